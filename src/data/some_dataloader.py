@@ -1,7 +1,360 @@
+import io
+import os
+import json
+import glob
+import fcntl
+import hashlib
 import torch
 import numpy as np
 import pandas as pd
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, IterableDataset, BatchSampler, RandomSampler, SequentialSampler, get_worker_info
+
+class Vocabulary():
+    """
+    Persisted, append-only mapping of names (subreddits, usernames) to dense int32 codes, stored in a text file
+    with one name per line, the code of a name being its line number. A code never changes once given, so codes
+    cached on disk stay valid and categorical columns of the vocabulary compare, group and join on the codes.
+
+    The categories of the dtype are the whole vocabulary, frames encoded before it grew have fewer categories
+    than the ones encoded after, align_vocab_columns brings them to the current dtype without recoding.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.size_bytes = 0
+        if os.path.exists(path):
+            with open(path, "rb") as vocab_file:
+                # Shared lock, add() of other processes writes whole lines under an exclusive one
+                fcntl.flock(vocab_file, fcntl.LOCK_SH)
+                try:
+                    self.extend(vocab_file.read())
+                finally:
+                    fcntl.flock(vocab_file, fcntl.LOCK_UN)
+        if not self.names:
+            self.index = pd.Index(self.names, dtype=object)
+            self.dtype = pd.CategoricalDtype(self.index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def extend(self, data):
+        """Add the names of lines read from the file"""
+        self.size_bytes += len(data)
+        if data:
+            self.names.extend(data.decode("utf-8").splitlines())
+            self.index = pd.Index(self.names, dtype=object)
+            self.dtype = pd.CategoricalDtype(self.index)
+
+    def refresh(self):
+        """Load the names appended by other processes since the file was read"""
+        with open(self.path, "rb") as vocab_file:
+            fcntl.flock(vocab_file, fcntl.LOCK_SH)
+            try:
+                vocab_file.seek(self.size_bytes)
+                self.extend(vocab_file.read())
+            finally:
+                fcntl.flock(vocab_file, fcntl.LOCK_UN)
+
+    def add(self, names):
+        """ Give the next codes to new names. The file is locked while the names appended by other processes
+        since it was read are loaded and the names still missing are appended, so that a name has a single code
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a+b") as vocab_file:
+            fcntl.flock(vocab_file, fcntl.LOCK_EX)
+            try:
+                vocab_file.seek(self.size_bytes)
+                self.extend(vocab_file.read())
+                names = [name for name, code in zip(names, self.index.get_indexer(names)) if code == -1]
+                data = "".join(f"{name}\n" for name in names).encode("utf-8")
+                # Appended at the end of the file whatever the position
+                vocab_file.write(data)
+                vocab_file.flush()
+                self.extend(data)
+            finally:
+                fcntl.flock(vocab_file, fcntl.LOCK_UN)
+
+    def digest(self, size_bytes=None):
+        """SHA-1 of the first size_bytes of the file (all of it by default), to check that cached codes still match"""
+        size_bytes = self.size_bytes if size_bytes is None else size_bytes
+        if size_bytes > self.size_bytes:
+            return None
+        with open(self.path, "rb") as vocab_file:
+            return hashlib.sha1(vocab_file.read(size_bytes)).hexdigest()
+
+    def encode(self, values):
+        """ Codes of values as strings, names seen for the first time are added to the vocabulary
+
+        Returns:
+            codes (np.ndarray): int32 codes, -1 for missing values
+        """
+        # Every distinct value is only looked up once
+        local_codes, uniques = pd.factorize(values)
+        names = np.array([str(name) for name in uniques], dtype=object)
+        codes = self.index.get_indexer(names)
+        if (codes == -1).any():
+            # Values such as 1 and "1" are the same name
+            self.add(pd.unique(names[codes == -1]).tolist())
+            codes = self.index.get_indexer(names)
+        return np.where(local_codes == -1, -1, codes[local_codes]).astype(np.int32)
+
+    def categorical(self, values):
+        """Values as a Categorical of the whole vocabulary, backed by their codes"""
+        return pd.Categorical.from_codes(self.encode(values), dtype=self.dtype)
+
+# Vocabulary of each column, subreddits share theirs across the post and hyperlink data
+vocab_columns = {
+    "SUBREDDIT": "subreddits",
+    "SOURCE_SUBREDDIT": "subreddits",
+    "TARGET_SUBREDDIT": "subreddits",
+    "USERNAME": "usernames",
+}
+
+_vocabularies = {}
+
+def get_vocabulary(vocab_dir, name):
+    """Vocabulary <vocab_dir>/<name>.txt, loaded once per process unless the file was extended by another process"""
+    path = os.path.abspath(os.path.join(vocab_dir, f"{name}.txt"))
+    vocabulary = _vocabularies.get(path)
+    size_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+    if vocabulary is None or size_bytes < vocabulary.size_bytes:
+        # Not loaded yet, or the file was rebuilt
+        vocabulary = _vocabularies[path] = Vocabulary(path)
+    elif size_bytes > vocabulary.size_bytes:
+        vocabulary.refresh()
+    return vocabulary
+
+def encode_vocab_columns(data, vocab_dir):
+    """Copy of data with its subreddit and username columns as categoricals of the shared vocabularies in vocab_dir"""
+    codes = {
+        column: get_vocabulary(vocab_dir, name).encode(data[column])
+        for column, name in vocab_columns.items() if column in data.columns
+    }
+    # The categoricals are built once every column is encoded, so that they all have the current categories
+    return data.assign(**{
+        column: pd.Categorical.from_codes(column_codes, dtype=get_vocabulary(vocab_dir, vocab_columns[column]).dtype)
+        for column, column_codes in codes.items()
+    })
+
+def align_vocab_columns(data, vocab_dir):
+    """ Copy of data encoded by encode_vocab_columns with the categories of the current vocabularies, e.g. posts loaded
+    before reading the hyperlinks added subreddits, so that they compare and concatenate with the frames encoded since
+    """
+    return data.assign(**{
+        column: pd.Categorical.from_codes(data[column].cat.codes, dtype=get_vocabulary(vocab_dir, name).dtype)
+        for column, name in vocab_columns.items() if column in data.columns and isinstance(data[column].dtype, pd.CategoricalDtype)
+    })
+
+def open_post_dataset(data_path, columns=None, subreddits=None, from_date=None, to_date=None):
+    """ Folder of Parquet / Arrow IPC post files as a pyarrow dataset, see read_post_data
+
+    Returns:
+        dataset (pyarrow.dataset.Dataset): the files of the folder
+        columns (list): columns to read, all the post columns if None was given
+        expression (pyarrow.dataset.Expression): filter of the posts to read, None for all of them
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    entries = os.listdir(data_path)
+    partitioned = any(entry.startswith("subreddit=") for entry in entries)
+    if partitioned:
+        partitioning = ds.partitioning(pa.schema([("subreddit", pa.string()), ("year_month", pa.string())]), flavor="hive")
+        data_format = "ipc" if any(f.endswith(".arrow") for _, _, files in os.walk(data_path) for f in files) else "parquet"
+    else:
+        partitioning = None
+        data_format = "ipc" if any(f.endswith(".arrow") for f in entries) else "parquet"
+    dataset = ds.dataset(data_path, format=data_format, partitioning=partitioning)
+
+    # Filters on the partition fields skip the other folders without opening their files
+    filters = []
+    if subreddits is not None:
+        filters.append(ds.field("subreddit" if partitioned else "SUBREDDIT").isin(list(subreddits)))
+    if from_date is not None:
+        if partitioned:
+            filters.append(ds.field("year_month") >= from_date[:7])
+        filters.append(ds.field("TIMESTAMP") >= pd.Timestamp(from_date).to_pydatetime())
+    if to_date is not None:
+        if partitioned:
+            filters.append(ds.field("year_month") <= to_date[:7])
+        filters.append(ds.field("TIMESTAMP") < pd.Timestamp(to_date).to_pydatetime())
+
+    if columns is None:
+        columns = [column for column in dataset.schema.names if column not in ("subreddit", "year_month")]
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return dataset, columns, expression
+
+def get_post_data_paths(data_path):
+    """CSV or JSON lines file of the post data, or its parts if the output was rotated by zst_to_gamer_gate_csv"""
+    if os.path.exists(data_path):
+        return [data_path]
+    directory, filename = os.path.split(data_path)
+    name, dot, extension = filename.partition(".")
+    data_paths = sorted(glob.glob(os.path.join(directory, f"{glob.escape(name)}.[0-9][0-9][0-9][0-9]{dot}{extension}")))
+    if not data_paths:
+        raise FileNotFoundError(data_path)
+    return data_paths
+
+def select_json_columns(frame, columns):
+    # Same column order as usecols in read_csv
+    return frame.reindex(columns=[column for column in frame.columns if column in columns]) if columns is not None else frame
+
+def filter_post_data(data, subreddits=None, from_date=None, to_date=None):
+    """Convert 'TIMESTAMP' to datetime and keep the posts of the subreddits and dates of read_post_data"""
+    if 'TIMESTAMP' in data.columns:
+        data['TIMESTAMP'] = pd.to_datetime(data['TIMESTAMP']) # Convert time
+    if subreddits is not None:
+        data = data[data['SUBREDDIT'].isin(subreddits)]
+    if from_date is not None:
+        data = data[data['TIMESTAMP'] >= from_date]
+    if to_date is not None:
+        data = data[data['TIMESTAMP'] < to_date]
+    return data
+
+def read_post_data(data_path, columns=None, subreddits=None, from_date=None, to_date=None, vocab_dir=None):
+    """ Read the post data extracted by zst_to_gamer_gate_csv
+
+    Args:
+        data_path (str): CSV or JSON lines file (possibly .zst compressed, or rotated in <name>.0000.<ext>, <name>.0001.<ext>, ...),
+            or folder of Parquet / Arrow IPC files (one per month), possibly partitioned in subreddit=<name>/year_month=<YYYY-MM>/ folders
+        columns (list): columns to read, all of them if None
+        subreddits (list): only read the posts of these subreddits, all of them if None
+        from_date (str): 'YYYY-MM-DD' only read the posts from this date (included)
+        to_date (str): 'YYYY-MM-DD' only read the posts before this date (excluded)
+        vocab_dir (str): folder of the vocabularies SUBREDDIT and USERNAME are coded with (see encode_vocab_columns),
+            they are left as read if None
+    Returns:
+        data (df): posts with a datetime 'TIMESTAMP' column
+    """
+    if os.path.isdir(data_path):
+        dataset, columns, expression = open_post_dataset(data_path, columns, subreddits, from_date, to_date)
+        # Only the requested columns are read, SUBREDDIT and USERNAME come back as categoricals
+        data = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        return encode_vocab_columns(data, vocab_dir) if vocab_dir is not None else data
+
+    frames = []
+    for path in get_post_data_paths(data_path):
+        if ".jsonl" in os.path.basename(path):
+            frames.append(select_json_columns(pd.read_json(path, lines=True, dtype=False), columns))
+        else:
+            frames.append(pd.read_csv(path, header=0, usecols=columns)) # Read CSV file
+    data = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    data = filter_post_data(data, subreddits, from_date, to_date)
+    if vocab_dir is not None:
+        data = encode_vocab_columns(data, vocab_dir)
+    return data
+
+# Names of the 86 values of the PROPERTIES column of the hyperlink network, in order
+liwc_cols = [
+    "chars","chars_no_ws","frac_alpha","frac_digits","frac_upper","frac_ws",
+    "frac_special","num_words","num_unique","num_long_words","avg_word_len",
+    "num_stopwords","frac_stopwords","num_sentences","num_long_sentences",
+    "avg_chars_sentence","avg_words_sentence","automated_readability",
+    "vader_pos","vader_neg","vader_compound",
+    "LIWC_Funct","LIWC_Pronoun","LIWC_Ppron","LIWC_I","LIWC_We","LIWC_You",
+    "LIWC_SheHe","LIWC_They","LIWC_Ipron","LIWC_Article","LIWC_Verbs",
+    "LIWC_AuxVb","LIWC_Past","LIWC_Present","LIWC_Future","LIWC_Adverbs",
+    "LIWC_Prep","LIWC_Conj","LIWC_Negate","LIWC_Quant","LIWC_Numbers",
+    "LIWC_Swear","LIWC_Social","LIWC_Family","LIWC_Friends","LIWC_Humans",
+    "LIWC_Affect","LIWC_Posemo","LIWC_Negemo","LIWC_Anx","LIWC_Anger",
+    "LIWC_Sad","LIWC_CogMech","LIWC_Insight","LIWC_Cause","LIWC_Discrep",
+    "LIWC_Tentat","LIWC_Certain","LIWC_Inhib","LIWC_Incl","LIWC_Excl",
+    "LIWC_Percept","LIWC_See","LIWC_Hear","LIWC_Feel","LIWC_Bio",
+    "LIWC_Body","LIWC_Health","LIWC_Sexual","LIWC_Ingest","LIWC_Relativ",
+    "LIWC_Motion","LIWC_Space","LIWC_Time","LIWC_Work","LIWC_Achiev",
+    "LIWC_Leisure","LIWC_Home","LIWC_Money","LIWC_Relig","LIWC_Death",
+    "LIWC_Assent","LIWC_Dissent","LIWC_Nonflu","LIWC_Filler"
+]
+
+# Bumped when the format of the RedditHyperlinkDataset cache changes
+CACHE_VERSION = 3
+
+def parse_properties(properties, chunk_size=2**16):
+    """ Parse the comma separated PROPERTIES strings of the hyperlink network
+
+    Args:
+        properties (Series): one string of len(liwc_cols) comma separated numbers per row
+        chunk_size (int): rows parsed at once by the C parser of numpy
+    Returns:
+        block (np.ndarray): contiguous (n_rows, len(liwc_cols)) float32 array
+    """
+    block = np.empty((len(properties), len(liwc_cols)), dtype=np.float32)
+    for start in range(0, len(properties), chunk_size):
+        text = "\n".join(properties.iloc[start:start + chunk_size].astype(str))
+        block[start:start + chunk_size] = np.loadtxt(io.StringIO(text), delimiter=",", dtype=np.float32, ndmin=2)
+    return block
+
+def get_codes(values):
+    """int64 codes of a column and the name of each code, the vocabulary codes for the categoricals of encode_vocab_columns"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(np.int64), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes.astype(np.int64), uniques
+
+def get_post_batch_columns(data):
+    """ Columns of the post datasets as arrays for get_batch
+
+    Returns:
+        batch_columns (dict): 'timestamp' int64 unix time, 'subreddit' and 'username' int64 codes, 'num_comments'
+            and the 'title' and 'body_text' strings, for the columns present in data
+        subreddits (Index): subreddit of each code, the shared vocabulary if SUBREDDIT is coded with it
+        usernames (Index): username of each code, the shared vocabulary if USERNAME is coded with it
+    """
+    batch_columns = {}
+    subreddits = usernames = None
+    if 'TIMESTAMP' in data.columns:
+        batch_columns['timestamp'] = data['TIMESTAMP'].to_numpy('datetime64[s]').view(np.int64)
+    if 'SUBREDDIT' in data.columns:
+        codes, subreddits = get_codes(data['SUBREDDIT'])
+        batch_columns['subreddit'] = codes
+    if 'USERNAME' in data.columns:
+        codes, usernames = get_codes(data['USERNAME'])
+        batch_columns['username'] = codes
+    if 'NUM_COMMENTS' in data.columns:
+        batch_columns['num_comments'] = data['NUM_COMMENTS'].to_numpy()
+    for column, key in (('TITLE', 'title'), ('BODY_TEXT', 'body_text')):
+        if column in data.columns:
+            batch_columns[key] = data[column].to_numpy(dtype=object)
+    return batch_columns, subreddits, usernames
+
+def batch_from_columns(batch_columns, indices):
+    """Rows indices of every column, numeric columns as tensors and text columns as lists"""
+    if isinstance(indices, torch.Tensor):
+        indices = indices.numpy()
+    indices = np.asarray(indices, dtype=np.int64)
+    batch = {}
+    for key, values in batch_columns.items():
+        values = values[indices]
+        batch[key] = values.tolist() if values.dtype == object else torch.from_numpy(values)
+    return batch
+
+class BatchedDataset(Dataset):
+    """Dataset whose items are whole batches: the indices of a batch sampler go to the get_batch of dataset at once"""
+
+    def __init__(self, dataset):
+        super().__init__()
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, indices):
+        return self.dataset.get_batch(indices)
+
+def batch_loader(dataset, batch_size=1, shuffle=False, drop_last=False, **kwargs):
+    """ DataLoader of the batches of dataset.get_batch, built with array indexing instead of batch_size calls to
+    __getitem__ and a collate. A plain DataLoader(dataset, batch_size=...) still goes through __getitem__
+
+    Args:
+        dataset (Dataset): dataset of this module
+        batch_size, shuffle, drop_last: as in DataLoader, other keyword arguments are passed to DataLoader
+    """
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    # batch_size=None: each index of the sampler is a list of indices and the batch is returned as is
+    return DataLoader(BatchedDataset(dataset), sampler=BatchSampler(sampler, batch_size, drop_last), batch_size=None, **kwargs)
 
 class RedditHyperlinkDataset(Dataset):
     """
@@ -10,50 +363,161 @@ class RedditHyperlinkDataset(Dataset):
         - __getitem__ (returns a sample from the dataset at the given index idx)
     """
 
-    def __init__(self, data_path_title = "data/soc-redditHyperlinks-title-cleaned.tsv", data_path_body = "data/soc-redditHyperlinks-body-cleaned.tsv"):
+    def __init__(self, data_path_title = "data/soc-redditHyperlinks-title-cleaned.tsv", data_path_body = "data/soc-redditHyperlinks-body-cleaned.tsv", cache_dir = "data/cache/hyperlink_dataset", vocab_dir = None):
         super().__init__()
 
         self.data_path_title = data_path_title  
         self.data_path_body = data_path_body
+        self.cache_dir = cache_dir
+        # With a vocab_dir (e.g. "data/vocab") SOURCE_SUBREDDIT and TARGET_SUBREDDIT are categoricals of the subreddit vocabulary
+        self.vocab_dir = vocab_dir
+
+        # The parsed dataset is cached as .npy files in cache_dir (None disables the cache), rebuilt when the TSVs change
+        if cache_dir is None or not self.load_cache():
+            self.parse()
+            if cache_dir is not None:
+                self.save_cache()
+
+        # Columns of get_batch, subreddits are coded by their position in self.subreddits
+        if vocab_dir is not None:
+            source_codes, self.subreddits = get_codes(self.data['SOURCE_SUBREDDIT'])
+            target_codes, _ = get_codes(self.data['TARGET_SUBREDDIT'])
+        else:
+            codes, self.subreddits = pd.factorize(pd.concat([self.data['SOURCE_SUBREDDIT'], self.data['TARGET_SUBREDDIT']], ignore_index=True))
+            source_codes, target_codes = codes[:len(self.data)].astype(np.int64), codes[len(self.data):].astype(np.int64)
+        self.batch_columns = {
+            'properties': np.asarray(self.properties),
+            'link_sentiment': self.data['LINK_SENTIMENT'].to_numpy(np.int64),
+            'source_subreddit': source_codes,
+            'target_subreddit': target_codes,
+            'timestamp': self.data['TIMESTAMP'].to_numpy('datetime64[s]').view(np.int64),
+        }
 
-        self.data_title = pd.read_csv(data_path_title, sep='\t', header=0) # Read TSV file
-        self.data_body = pd.read_csv(data_path_body, sep='\t', header=0) # Read TSV file
+    def parse(self):
+        self.data_title = pd.read_csv(self.data_path_title, sep='\t', header=0) # Read TSV file
+        self.data_body = pd.read_csv(self.data_path_body, sep='\t', header=0) # Read TSV file
 
         self.data_title['TIMESTAMP'] = pd.to_datetime(self.data_title['TIMESTAMP']) # Convert time
         self.data_body['TIMESTAMP'] = pd.to_datetime(self.data_body['TIMESTAMP']) # Convert time
 
-        self.data_title['PROPERTIES'] = self.data_title['PROPERTIES'].apply(lambda x: [float(i) for i in str(x).split(',')])
-        self.data_body['PROPERTIES'] = self.data_body['PROPERTIES'].apply(lambda x: [float(i) for i in str(x).split(',')])
+        if self.vocab_dir is not None:
+            self.data_title = encode_vocab_columns(self.data_title, self.vocab_dir)
+            self.data_body = encode_vocab_columns(self.data_body, self.vocab_dir)
+            # The body may have added subreddits since the title was encoded
+            self.data_title = align_vocab_columns(self.data_title, self.vocab_dir)
 
+        # Categoricals of the same vocabulary stay categoricals
         self.data = pd.concat([self.data_title, self.data_body], ignore_index=True, sort=False)
 
-        liwc_cols = [
-            "chars","chars_no_ws","frac_alpha","frac_digits","frac_upper","frac_ws",
-            "frac_special","num_words","num_unique","num_long_words","avg_word_len",
-            "num_stopwords","frac_stopwords","num_sentences","num_long_sentences",
-            "avg_chars_sentence","avg_words_sentence","automated_readability",
-            "vader_pos","vader_neg","vader_compound",
-            "LIWC_Funct","LIWC_Pronoun","LIWC_Ppron","LIWC_I","LIWC_We","LIWC_You",
-            "LIWC_SheHe","LIWC_They","LIWC_Ipron","LIWC_Article","LIWC_Verbs",
-            "LIWC_AuxVb","LIWC_Past","LIWC_Present","LIWC_Future","LIWC_Adverbs",
-            "LIWC_Prep","LIWC_Conj","LIWC_Negate","LIWC_Quant","LIWC_Numbers",
-            "LIWC_Swear","LIWC_Social","LIWC_Family","LIWC_Friends","LIWC_Humans",
-            "LIWC_Affect","LIWC_Posemo","LIWC_Negemo","LIWC_Anx","LIWC_Anger",
-            "LIWC_Sad","LIWC_CogMech","LIWC_Insight","LIWC_Cause","LIWC_Discrep",
-            "LIWC_Tentat","LIWC_Certain","LIWC_Inhib","LIWC_Incl","LIWC_Excl",
-            "LIWC_Percept","LIWC_See","LIWC_Hear","LIWC_Feel","LIWC_Bio",
-            "LIWC_Body","LIWC_Health","LIWC_Sexual","LIWC_Ingest","LIWC_Relativ",
-            "LIWC_Motion","LIWC_Space","LIWC_Time","LIWC_Work","LIWC_Achiev",
-            "LIWC_Leisure","LIWC_Home","LIWC_Money","LIWC_Relig","LIWC_Death",
-            "LIWC_Assent","LIWC_Dissent","LIWC_Nonflu","LIWC_Filler"
-        ]
-
-        def unpack_properties(row):
-            return {col: row[i] for i, col in enumerate(liwc_cols)}
-
-        liwc_df = self.data['PROPERTIES'].apply(unpack_properties).apply(pd.Series)
-
-        self.data = pd.concat([self.data, liwc_df], axis=1)
+        # All the properties in a single (n_rows, 86) float32 block
+        self.properties = parse_properties(self.data['PROPERTIES'])
+        self.set_properties()
+
+    def set_properties(self):
+        # The property columns are views on the block, the PROPERTIES strings are dropped (use self.properties for the vectors)
+        n_title = len(self.data_title)
+        properties = np.asarray(self.properties)
+        self.data = pd.concat([self.data.drop(columns='PROPERTIES', errors='ignore'),
+                               pd.DataFrame(properties, columns=liwc_cols, copy=False)], axis=1, copy=False)
+        self.data_title = pd.concat([self.data_title.drop(columns='PROPERTIES', errors='ignore'),
+                                     pd.DataFrame(properties[:n_title], columns=liwc_cols, copy=False)], axis=1, copy=False)
+        self.data_body = pd.concat([self.data_body.drop(columns='PROPERTIES', errors='ignore'),
+                                    pd.DataFrame(properties[n_title:], columns=liwc_cols, copy=False)], axis=1, copy=False)
+
+    def cache_sources(self):
+        sources = []
+        for data_path in (self.data_path_title, self.data_path_body):
+            stat = os.stat(data_path)
+            sources.append({"path": os.path.abspath(data_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        return sources
+
+    def cache_vocab_dir(self):
+        return os.path.abspath(self.vocab_dir) if self.vocab_dir is not None else None
+
+    def cache_vocabularies(self):
+        # Size and hash of the subreddit vocabulary when the codes were cached, a vocabulary rebuilt since gives other codes
+        if self.vocab_dir is None:
+            return None
+        vocabulary = get_vocabulary(self.vocab_dir, "subreddits")
+        return {"subreddits": {"size": len(vocabulary), "size_bytes": vocabulary.size_bytes, "sha1": vocabulary.digest()}}
+
+    def save_cache(self):
+        """ Write the parsed dataset to cache_dir: properties.npy with the float32 block, a .npy per column
+        (vocabulary columns as their int32 vocabulary codes, other object columns as int32 codes plus their categories,
+        timestamps as int64 nanoseconds) and meta.json, written last, with the version of the format, the vocabulary
+        folder and the size and mtime of the TSVs
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(os.path.join(self.cache_dir, "properties.npy"), self.properties)
+
+        columns = []
+        for column in self.data_title.columns:
+            if column in liwc_cols:
+                continue
+            values = self.data[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                kind = "datetime"
+                np.save(os.path.join(self.cache_dir, f"{column}.npy"), values.to_numpy('datetime64[ns]').view(np.int64))
+            elif pd.api.types.is_numeric_dtype(values):
+                kind = "numeric"
+                np.save(os.path.join(self.cache_dir, f"{column}.npy"), values.to_numpy())
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                # Vocabularies are append-only, the codes stay valid
+                kind = "vocab"
+                np.save(os.path.join(self.cache_dir, f"{column}.npy"), values.cat.codes.to_numpy(np.int32))
+            else:
+                kind = "factorized"
+                codes, categories = pd.factorize(values)
+                np.save(os.path.join(self.cache_dir, f"{column}.npy"), codes.astype(np.int32))
+                np.save(os.path.join(self.cache_dir, f"{column}.categories.npy"), np.asarray(categories, dtype=str))
+            columns.append([column, kind])
+
+        meta = {"version": CACHE_VERSION, "sources": self.cache_sources(), "vocab_dir": self.cache_vocab_dir(),
+                "vocabularies": self.cache_vocabularies(), "n_title": len(self.data_title), "columns": columns}
+        tmp_path = os.path.join(self.cache_dir, "meta.json.tmp")
+        with open(tmp_path, "w", encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file, indent=1)
+        os.replace(tmp_path, os.path.join(self.cache_dir, "meta.json"))
+
+    def load_cache(self):
+        """ Load the dataset from cache_dir if it was built from the current TSVs, the property block is memory-mapped
+
+        Returns:
+            loaded (bool): False if there is no valid cache
+        """
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta["version"] != CACHE_VERSION or meta["sources"] != self.cache_sources() or meta["vocab_dir"] != self.cache_vocab_dir():
+            return False
+        # The vocabulary may only have grown since, its beginning must be the one the codes were cached with
+        for name, cached in (meta["vocabularies"] or {}).items():
+            vocabulary = get_vocabulary(self.vocab_dir, name)
+            if len(vocabulary) < cached["size"] or vocabulary.digest(cached["size_bytes"]) != cached["sha1"]:
+                return False
+
+        # Copy-on-write maps: the columns are writable as after parse(), pages only get copied when modified and the cache is never written
+        self.properties = np.load(os.path.join(self.cache_dir, "properties.npy"), mmap_mode='c')
+        data = {}
+        for column, kind in meta["columns"]:
+            values = np.load(os.path.join(self.cache_dir, f"{column}.npy"), mmap_mode='c')
+            if kind == "datetime":
+                values = values.view('datetime64[ns]')
+            elif kind == "factorized":
+                categories = np.load(os.path.join(self.cache_dir, f"{column}.categories.npy")).astype(object)
+                values = np.asarray(pd.Categorical.from_codes(values, categories), dtype=object)
+            elif kind == "vocab":
+                values = pd.Categorical.from_codes(values, dtype=get_vocabulary(self.vocab_dir, vocab_columns[column]).dtype)
+            data[column] = values
+        self.data = pd.DataFrame(data)
+
+        n_title = meta["n_title"]
+        self.data_title = self.data.iloc[:n_title].reset_index(drop=True)
+        self.data_body = self.data.iloc[n_title:].reset_index(drop=True)
+        self.set_properties()
+        return True
     
     def __len__(self):
         return len(self.data)
@@ -71,7 +535,7 @@ class RedditHyperlinkDataset(Dataset):
         post_id = row.get('POST_ID') if 'POST_ID' in self.data.columns else None
         timestamp = row.get('TIMESTAMP') if 'TIMESTAMP' in self.data.columns else None
         link_sentiment = row.get('LINK_SENTIMENT') if 'LINK_SENTIMENT' in self.data.columns else None
-        properties = row.get('PROPERTIES') if 'PROPERTIES' in self.data.columns else None
+        properties = np.asarray(self.properties)[idx]
 
         sample = {
             'source_subreddit': source,
@@ -84,6 +548,15 @@ class RedditHyperlinkDataset(Dataset):
 
         return sample
 
+    def get_batch(self, indices):
+        """ Batch of samples as tensors, see batch_loader
+
+        Returns:
+            batch (dict): 'properties' float32 (batch, 86), 'link_sentiment' int64, 'source_subreddit' and 'target_subreddit'
+                int64 codes of self.subreddits, 'timestamp' int64 unix time
+        """
+        return batch_from_columns(self.batch_columns, indices)
+
 class RedditPostDataset(Dataset):
     """
     A dataset implements 2 functions
@@ -91,14 +564,17 @@ class RedditPostDataset(Dataset):
         - __getitem__ (returns a sample from the dataset at the given index idx)
     """
 
-    def __init__(self, data_path = "data/gamergate_post_data.csv"):
+    def __init__(self, data_path = "data/gamergate_post_data.csv", columns = None, subreddits = None, from_date = None, to_date = None, vocab_dir = None):
         super().__init__()
 
         self.data_path = data_path
-        self.data = pd.read_csv(data_path, header=0) # Read CSV file
+        # With a vocab_dir (e.g. "data/vocab") SUBREDDIT and USERNAME are categoricals of the vocabularies
+        self.data = read_post_data(data_path, columns, subreddits, from_date, to_date, vocab_dir)
+
+        if 'SUBREDDIT' in self.data.columns:
+            self.data = self.data[~(self.data['SUBREDDIT'] == 'the_donald')] # getting rid of unrelated subreddit
 
-        self.data['TIMESTAMP'] = pd.to_datetime(self.data['TIMESTAMP']) # Convert time
-        self.data = self.data[~(self.data['SUBREDDIT'] == 'the_donald')] # getting rid of unrelated subreddit
+        self.batch_columns, self.subreddits, self.usernames = get_post_batch_columns(self.data)
     
     def __len__(self):
         return len(self.data)
@@ -131,6 +607,10 @@ class RedditPostDataset(Dataset):
 
         return sample
 
+    def get_batch(self, indices):
+        """ Batch of samples, see batch_loader and get_post_batch_columns """
+        return batch_from_columns(self.batch_columns, indices)
+
 class RedditPoliticalPostDataset(Dataset):
     """
     A dataset implements 2 functions
@@ -138,13 +618,14 @@ class RedditPoliticalPostDataset(Dataset):
         - __getitem__ (returns a sample from the dataset at the given index idx)
     """
 
-    def __init__(self, data_path = "data/gamergate_post_data.csv"):
+    def __init__(self, data_path = "data/gamergate_post_data.csv", columns = None, subreddits = None, from_date = None, to_date = None, vocab_dir = None):
         super().__init__()
 
         self.data_path = data_path
-        self.data = pd.read_csv(data_path, header=0) # Read CSV file
+        # With a vocab_dir (e.g. "data/vocab") SUBREDDIT and USERNAME are categoricals of the vocabularies
+        self.data = read_post_data(data_path, columns, subreddits, from_date, to_date, vocab_dir)
 
-        self.data['TIMESTAMP'] = pd.to_datetime(self.data['TIMESTAMP']) # Convert time
+        self.batch_columns, self.subreddits, self.usernames = get_post_batch_columns(self.data)
     
     def __len__(self):
         return len(self.data)
@@ -177,6 +658,139 @@ class RedditPoliticalPostDataset(Dataset):
 
         return sample
 
+    def get_batch(self, indices):
+        """ Batch of samples, see batch_loader and get_post_batch_columns """
+        return batch_from_columns(self.batch_columns, indices)
+
+class RedditPostStream(IterableDataset):
+    """
+    Posts of read_post_data streamed from disk in chunks of chunk_size rows, for corpora whose bodies do not fit
+    in memory. Each sample is a dict with the columns present, as in a batch of RedditPostDataset.get_batch:
+    'timestamp' unix time, 'subreddit', 'username', 'num_comments', 'title', 'body_text' and 'post_id'.
+
+    With DataLoader workers every worker reads a disjoint share of the posts:
+        - Parquet folders: the row groups, Arrow IPC folders: the files, dealt round robin
+        - JSON lines files: a byte range of each file, a line belonging to the range its first byte is in
+        - CSV and compressed files (bodies may span several lines): each worker parses the file and keeps
+          every num_workers-th chunk
+
+    Only folders and JSON lines files split the reading: with a CSV or compressed file N workers cost N full parses of it,
+    so that more workers do not read it faster. For multi-worker training, first write a Parquet folder or an
+    uncompressed JSON lines file of the posts with zst_to_gamer_gate_csv (-f parquet or -f jsonl).
+
+    With shuffle_buffer > 0 the samples come out of a buffer of that many samples, in random order.
+    """
+
+    def __init__(self, data_path = "data/gamergate_post_data.csv", columns = None, subreddits = None, from_date = None, to_date = None,
+                 exclude_subreddits = None, chunk_size = 2**12, shuffle_buffer = 0, seed = None):
+        super().__init__()
+
+        self.data_path = data_path
+        self.columns = columns
+        self.subreddits = subreddits
+        self.from_date = from_date
+        self.to_date = to_date
+        # e.g. ["the_donald"] for the posts of RedditPostDataset
+        self.exclude_subreddits = exclude_subreddits
+        self.chunk_size = chunk_size
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+
+    def iter_dataset_chunks(self, worker_id, num_workers):
+        import pyarrow.dataset as ds
+
+        dataset, columns, expression = open_post_dataset(self.data_path, self.columns, self.subreddits, self.from_date, self.to_date)
+        # Files of other partitions are skipped, and row groups whose statistics do not match the filter
+        fragments = dataset.get_fragments(filter=expression)
+        if isinstance(dataset.format, ds.ParquetFileFormat):
+            fragments = (row_group for fragment in fragments for row_group in fragment.split_by_row_group(filter=expression, schema=dataset.schema))
+        for i, fragment in enumerate(fragments):
+            if i % num_workers != worker_id:
+                continue
+            for batch in fragment.to_batches(schema=dataset.schema, columns=columns, filter=expression, batch_size=self.chunk_size):
+                yield batch.to_pandas()
+
+    def iter_json_range(self, path, worker_id, num_workers):
+        size = os.path.getsize(path)
+        start, end = size * worker_id // num_workers, size * (worker_id + 1) // num_workers
+        with open(path, "rb") as json_file:
+            if start > 0:
+                # The line going over start belongs to the previous range
+                json_file.seek(start - 1)
+                json_file.readline()
+            lines = []
+            while json_file.tell() < end:
+                line = json_file.readline()
+                if not line:
+                    break
+                lines.append(line)
+                if len(lines) == self.chunk_size:
+                    yield pd.read_json(io.BytesIO(b"".join(lines)), lines=True, dtype=False)
+                    lines = []
+            if lines:
+                yield pd.read_json(io.BytesIO(b"".join(lines)), lines=True, dtype=False)
+
+    def iter_file_chunks(self, worker_id, num_workers):
+        for path in get_post_data_paths(self.data_path):
+            filename = os.path.basename(path)
+            if filename.endswith(".jsonl"):
+                chunks = self.iter_json_range(path, worker_id, num_workers)
+            else:
+                if ".jsonl" in filename:
+                    reader = pd.read_json(path, lines=True, dtype=False, chunksize=self.chunk_size)
+                else:
+                    reader = pd.read_csv(path, header=0, usecols=self.columns, chunksize=self.chunk_size)
+                # Every worker parses all the chunks, see the class docstring
+                chunks = (chunk for i, chunk in enumerate(reader) if i % num_workers == worker_id)
+            for chunk in chunks:
+                if ".jsonl" in filename:
+                    chunk = select_json_columns(chunk, self.columns)
+                yield filter_post_data(chunk, self.subreddits, self.from_date, self.to_date)
+
+    def iter_samples(self, worker_id, num_workers):
+        chunks = self.iter_dataset_chunks(worker_id, num_workers) if os.path.isdir(self.data_path) else self.iter_file_chunks(worker_id, num_workers)
+        for chunk in chunks:
+            if self.exclude_subreddits is not None and 'SUBREDDIT' in chunk.columns:
+                chunk = chunk[~chunk['SUBREDDIT'].isin(self.exclude_subreddits)]
+            if len(chunk) == 0:
+                continue
+            columns, _, _ = get_post_batch_columns(chunk)
+            # Missing texts as empty strings, default_collate needs the same type in every sample
+            for key in ('title', 'body_text'):
+                if key in columns:
+                    columns[key] = np.array(["" if pd.isna(text) else text for text in columns[key]], dtype=object)
+            # Names rather than the codes of the chunk
+            if 'subreddit' in columns:
+                columns['subreddit'] = chunk['SUBREDDIT'].to_numpy(dtype=object)
+            if 'username' in columns:
+                columns['username'] = chunk['USERNAME'].to_numpy(dtype=object)
+            if 'POST_ID' in chunk.columns:
+                columns['post_id'] = chunk['POST_ID'].to_numpy(dtype=object)
+            keys = list(columns)
+            for values in zip(*(columns[key].tolist() for key in keys)):
+                yield dict(zip(keys, values))
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        samples = self.iter_samples(worker_id, num_workers)
+        if self.shuffle_buffer <= 0:
+            yield from samples
+            return
+
+        # Each worker shuffles its own samples, seeded by worker so that the workers do not draw the same permutation
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, worker_id])
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            i = rng.integers(len(buffer))
+            yield buffer[i]
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
 class SomeDatamodule(DataLoader):
     """
     Allows you to sample train/val/test data, to later do training with models.
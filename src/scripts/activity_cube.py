@@ -0,0 +1,272 @@
+# Daily activity cube: number of posts per day and subreddit as a sparse days x subreddits matrix
+# Unlike the posts per day CSV each (day, subreddit) pair has a single count, whatever monthly file its posts came from
+
+import os
+import json
+import logging.handlers
+import argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from zst_utils import Sink, get_input_files, get_subreddit, scan_submissions
+
+
+log = logging.getLogger("bot")
+
+
+def date_to_day(date):
+	"""Days since 1970-01-01 of a date ("YYYY-MM-DD", datetime, ...), the row of the date in the cube"""
+	return int(pd.Timestamp(date).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+def day_to_date(days):
+	"""Inverse of date_to_day for an array of days"""
+	return np.asarray(days, dtype=np.int64).astype('datetime64[D]')
+
+
+class ActivityCube():
+	"""
+	Post counts stored in <path>/ as:
+		- subreddits_<generation>.txt: the subreddit dictionary, the code of a subreddit is its line number
+		- counts_<generation>.npz: CSR matrix, one row per day since 1970-01-01 and one column per subreddit code
+		- delta_<RS_YYYY-MM>.npz: counts of a monthly file added since the last compact()
+		- meta.json: current generation and monthly files included in it
+
+	Adding a monthly file only writes its delta, compact() folds the deltas into a new generation
+	and switches meta.json to it, so an interrupted update never leaves the cube half written.
+	In memory the deltas are kept as (day, code, count) triples and summed into the matrix at once,
+	when it is first read through counts after being added to.
+	"""
+
+	def __init__(self, path="data/activity_cube"):
+		self.path = path
+		self.generation = 0
+		self.files = []
+		self.subreddits = []
+		self.subreddit_codes = {}
+		self._counts = scipy.sparse.csr_matrix((0, 0), dtype=np.int64)
+		self.pending = []
+		self.deltas = []
+
+		meta_path = os.path.join(path, "meta.json")
+		if not os.path.exists(meta_path):
+			return
+		with open(meta_path, "r", encoding='utf-8') as meta_file:
+			meta = json.load(meta_file)
+		self.generation = meta["generation"]
+		self.files = meta["files"]
+		if self.generation:
+			with open(os.path.join(path, f"subreddits_{self.generation}.txt"), "r", encoding='utf-8') as subreddits_file:
+				self.subreddits = subreddits_file.read().splitlines()
+			self.subreddit_codes = {subreddit: code for code, subreddit in enumerate(self.subreddits)}
+			self._counts = scipy.sparse.load_npz(os.path.join(path, f"counts_{self.generation}.npz")).astype(np.int64)
+
+		# Monthly files added after the last compact()
+		for filename in sorted(os.listdir(path)):
+			if filename.startswith("delta_") and filename.endswith(".npz"):
+				name = filename[len("delta_"):-len(".npz")]
+				if name in self.files:
+					continue
+				with np.load(os.path.join(path, filename)) as delta:
+					self._add(delta["days"], delta["subreddits"][delta["codes"]], delta["counts"])
+				self.files.append(name)
+				self.deltas.append(filename)
+
+	def __len__(self):
+		return len(self.subreddits)
+
+	def _encode(self, subreddits):
+		codes = np.empty(len(subreddits), dtype=np.int64)
+		for i, subreddit in enumerate(subreddits):
+			code = self.subreddit_codes.get(subreddit)
+			if code is None:
+				code = len(self.subreddits)
+				self.subreddit_codes[subreddit] = code
+				self.subreddits.append(subreddit)
+			codes[i] = code
+		return codes
+
+	def _add(self, days, subreddits, counts):
+		# Only encoded here, the matrix is rebuilt once for all the pending triples by counts
+		unique_subreddits, local_codes = np.unique(np.asarray(subreddits, dtype=str), return_inverse=True)
+		codes = self._encode(unique_subreddits.tolist())[local_codes]
+		self.pending.append((np.asarray(days, dtype=np.int64), codes, np.asarray(counts, dtype=np.int64)))
+
+	@property
+	def counts(self):
+		"""CSR matrix of the counts, one row per day since 1970-01-01 and one column per subreddit code"""
+		if self.pending:
+			# Same (day, subreddit) pairs are summed by the COO -> CSR conversion
+			stored = self._counts.tocoo()
+			days, codes, counts = (np.concatenate(values) for values in zip(*self.pending))
+			shape = (max(stored.shape[0], int(days.max()) + 1 if len(days) else 0), len(self.subreddits))
+			self._counts = scipy.sparse.csr_matrix((np.concatenate([stored.data, counts]),
+				(np.concatenate([stored.row, days]), np.concatenate([stored.col, codes]))), shape=shape)
+			self.pending = []
+		return self._counts
+
+	def add_file(self, name, days, subreddits, counts):
+		"""Add the counts of a monthly file, written right away as a delta
+
+		Args:
+			name (str): name of the monthly file, added only once
+			days (np.ndarray): days since 1970-01-01
+			subreddits (np.ndarray): lower case subreddit of each count
+			counts (np.ndarray): number of posts of the (day, subreddit) pairs
+		"""
+		if name in self.files:
+			log.info(f"{name} is already in {self.path}")
+			return
+		os.makedirs(self.path, exist_ok=True)
+		unique_subreddits, local_codes = np.unique(np.asarray(subreddits, dtype=str), return_inverse=True)
+		filename = f"delta_{name}.npz"
+		tmp_path = os.path.join(self.path, f"{filename}.tmp.npz")
+		np.savez(tmp_path, days=np.asarray(days, dtype=np.int32), subreddits=unique_subreddits,
+			codes=local_codes.astype(np.int32), counts=np.asarray(counts, dtype=np.int64))
+		os.replace(tmp_path, os.path.join(self.path, filename))
+
+		self._add(days, unique_subreddits[local_codes], counts)
+		self.files.append(name)
+		self.deltas.append(filename)
+
+	def compact(self):
+		"""Fold the deltas into a new generation of the dictionary and matrix"""
+		if not self.deltas and self.generation:
+			return
+		os.makedirs(self.path, exist_ok=True)
+		generation = self.generation + 1
+		with open(os.path.join(self.path, f"subreddits_{generation}.txt"), "w", encoding='utf-8') as subreddits_file:
+			subreddits_file.write("".join(f"{subreddit}\n" for subreddit in self.subreddits))
+		scipy.sparse.save_npz(os.path.join(self.path, f"counts_{generation}.npz"), self.counts.astype(np.int32))
+
+		tmp_path = os.path.join(self.path, "meta.json.tmp")
+		with open(tmp_path, "w", encoding='utf-8') as meta_file:
+			json.dump({"generation": generation, "files": self.files}, meta_file, indent=1)
+		os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+		# The new generation is live, drop what it replaces
+		for filename in self.deltas + [f"subreddits_{self.generation}.txt", f"counts_{self.generation}.npz"]:
+			if os.path.exists(os.path.join(self.path, filename)):
+				os.remove(os.path.join(self.path, filename))
+		self.generation = generation
+		self.deltas = []
+		log.info(f"Saved {self.counts.nnz:,} daily counts of {len(self.subreddits):,} subreddits to {self.path}")
+
+	def _day_range(self, from_date=None, to_date=None):
+		start = date_to_day(from_date) if from_date is not None else 0
+		end = date_to_day(to_date) + 1 if to_date is not None else self.counts.shape[0]
+		return max(start, 0), max(min(end, self.counts.shape[0]), max(start, 0))
+
+	def time_series(self, subreddit, from_date=None, to_date=None):
+		""" Number of posts per day of a subreddit, days without posts included
+
+		Args:
+			subreddit (str): subreddit name
+			from_date, to_date: first and last day (inclusive), the whole cube by default
+		Returns:
+			posts (pd.Series): post count indexed by date
+		"""
+		start = date_to_day(from_date) if from_date is not None else 0
+		end = date_to_day(to_date) + 1 if to_date is not None else self.counts.shape[0]
+		if from_date is None:
+			# Start at the first day with any post rather than in 1970
+			non_empty = np.flatnonzero(np.diff(self.counts.indptr))
+			start = int(non_empty[0]) if len(non_empty) else end
+		end = max(start, end)
+		values = np.zeros(end - start, dtype=np.int64)
+		code = self.subreddit_codes.get(subreddit.lower())
+		# Days before 1970 or after the last row have no posts
+		stored_start, stored_end = max(start, 0), min(end, self.counts.shape[0])
+		if code is not None and stored_end > stored_start:
+			values[stored_start - start:stored_end - start] = self.counts[stored_start:stored_end, code].toarray().ravel()
+		return pd.Series(values, index=pd.DatetimeIndex(day_to_date(np.arange(start, end)), name="date"), name=subreddit)
+
+	def top_k(self, from_date=None, to_date=None, k=10):
+		""" Subreddits with the most posts over a date range
+
+		Returns:
+			posts (pd.Series): post count of the k subreddits, indexed by subreddit, most posts first
+		"""
+		start, end = self._day_range(from_date, to_date)
+		totals = np.asarray(self.counts[start:end].sum(axis=0)).ravel()
+		top = np.argsort(-totals, kind='stable')[:k]
+		top = top[totals[top] > 0]
+		return pd.Series(totals[top], index=pd.Index(np.asarray(self.subreddits, dtype=object)[top], name="subreddit"), name="post_count")
+
+	def to_posts_per_day(self, subreddits=None, from_date=None, to_date=None):
+		""" Counts in the format of zst_posts_per_day_per_sub.csv (date, subreddit, post_count), one row per pair
+
+		Args:
+			subreddits (list): only these subreddits, all by default
+			from_date, to_date: first and last day (inclusive), the whole cube by default
+		"""
+		start, end = self._day_range(from_date, to_date)
+		counts = self.counts[start:end]
+		if subreddits is not None:
+			codes = [self.subreddit_codes[subreddit.lower()] for subreddit in subreddits if subreddit.lower() in self.subreddit_codes]
+			counts = counts[:, codes]
+		else:
+			codes = np.arange(len(self.subreddits))
+		counts = counts.tocoo()
+		order = np.lexsort((counts.col, counts.row))
+		return pd.DataFrame({
+			"date": pd.DatetimeIndex(day_to_date(counts.row[order] + start)).strftime('%Y-%m-%d'),
+			"subreddit": np.asarray(self.subreddits, dtype=object)[np.asarray(codes)[counts.col[order]]],
+			"post_count": counts.data[order],
+		})
+
+
+class ActivityCubeSink(Sink):
+	"""Adds the daily post counts of each monthly file to an ActivityCube, monthly files already in the cube are skipped"""
+
+	def __init__(self, cube_path="data/activity_cube"):
+		self.cube_path = cube_path
+		self.cube = None
+		self.day_counts = Counter()
+
+	def config(self):
+		return {"sink": type(self).__name__, "cube_path": self.cube_path}
+
+	def open(self, checkpoint=None):
+		# The cube records which monthly files it holds, nothing to restore
+		self.cube = ActivityCube(self.cube_path)
+
+	def process(self, obj):
+		self.day_counts[(int(obj['created_utc']) // 86400, get_subreddit(obj))] += 1
+
+	def flush(self, input_file):
+		day_counts = self.day_counts
+		self.day_counts = Counter()
+		days = np.fromiter((day for day, _ in day_counts), dtype=np.int32, count=len(day_counts))
+		subreddits = np.array([subreddit for _, subreddit in day_counts], dtype=str)
+		counts = np.fromiter(day_counts.values(), dtype=np.int64, count=len(day_counts))
+		return os.path.basename(input_file[0]).split('.')[0], days, subreddits, counts
+
+	def merge(self, result):
+		self.cube.add_file(*result)
+
+	def checkpoint(self):
+		return {"files": len(self.cube.files)}
+
+	def close(self):
+		self.cube.compact()
+
+
+# Only the monthly files missing from the cube are scanned
+def build_activity_cube(workers=1, cube_path="data/activity_cube"):
+	input_files, total_size = get_input_files()
+	done = set(ActivityCube(cube_path).files)
+	input_files = [input_file for input_file in input_files if os.path.basename(input_file[0]).split('.')[0] not in done]
+	scan_submissions(input_files, [ActivityCubeSink(cube_path)], workers)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser("activity_cube")
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('-c', '--cube', help="Directory of the activity cube", type=str, default="data/activity_cube")
+	parser.add_argument('-e', '--export', help="Also write the cube as a posts per day CSV to this path", type=str, required=False)
+	args = parser.parse_args()
+
+	build_activity_cube(workers=args.workers, cube_path=args.cube)
+	if args.export:
+		ActivityCube(args.cube).to_posts_per_day().to_csv(args.export, index=False)
@@ -0,0 +1,47 @@
+# Micro-benchmark of the JSON backends of zst_utils on the first lines of a monthly dump
+
+import time
+import argparse
+from itertools import islice
+from zst_utils import read_lines_zst, get_input_files, get_json_loads, json_backends
+
+
+def benchmark_json_backends(input_path, n_lines=200000, repeat=3):
+	"""Print the lines/sec of every installed JSON backend on a sample of the dump.
+
+	Args:
+		input_path (str): .zst file to sample
+		n_lines (int): number of lines in the sample
+		repeat (int): the best of repeat runs is reported
+	"""
+	lines = [line for line, _ in islice(read_lines_zst(input_path), n_lines)]
+	print(f"Sample: {len(lines):,} lines, {sum(len(line) for line in lines) / 2**20:.1f} MiB from {input_path}")
+
+	for backend in json_backends:
+		try:
+			name, loads = get_json_loads(backend)
+		except ImportError:
+			print(f"{backend:>8}: not installed")
+			continue
+
+		best = float("inf")
+		for _ in range(repeat):
+			start = time.perf_counter()
+			for line in lines:
+				loads(line)
+			best = min(best, time.perf_counter() - start)
+		print(f"{name:>8}: {len(lines) / best:,.0f} lines/sec")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser("benchmark_json_backends")
+	parser.add_argument('-i', '--input_path', help="Dump to sample, the oldest monthly file by default", type=str, required=False)
+	parser.add_argument('-n', '--n_lines', help="Number of lines in the sample", type=int, default=200000)
+	args = parser.parse_args()
+
+	input_path = args.input_path
+	if input_path is None:
+		input_files, _ = get_input_files()
+		input_path = input_files[0][0]
+
+	benchmark_json_backends(input_path, n_lines=args.n_lines)
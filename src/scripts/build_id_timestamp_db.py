@@ -1,104 +1,257 @@
 # SOURCE: https://github.com/Watchful1/PushshiftDumps/blob/master/scripts/iterate_folder.py
 # Modified by Robin
 
-import zstandard
 import os
 import json
-import sys
-from datetime import datetime, UTC
 import logging.handlers
-import csv
 import sqlite3
+import argparse
+from array import array
+import numpy as np
+import pandas as pd
+from zst_utils import Sink, get_input_files, scan_submissions, input_folder
 
 log = logging.getLogger("bot")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
 
 
-def read_and_decode(reader, chunk_size, max_window_size, previous_chunk=None, bytes_read=0):
-	chunk = reader.read(chunk_size)
-	bytes_read += chunk_size
-	if previous_chunk is not None:
-		chunk = previous_chunk + chunk
-	try:
-		return chunk.decode()
-	except UnicodeDecodeError:
-		if bytes_read > max_window_size:
-			raise UnicodeError(f"Unable to decode frame after reading {bytes_read:,} bytes")
-		log.info(f"Decoding error with {bytes_read:,} bytes, reading another chunk")
-		return read_and_decode(reader, chunk_size, max_window_size, chunk, bytes_read)
+# Post IDs are base36 numbers, as integers they are the rowid of the table
+def post_id_to_int(post_id):
+	return int(post_id, 36)
 
+def post_ids_to_int(post_ids):
+	"""Base36 decode an array of post IDs, -1 for invalid ones"""
+	decoded = np.full(len(post_ids), -1, dtype=np.int64)
+	for i, post_id in enumerate(post_ids):
+		try:
+			decoded[i] = post_id_to_int(post_id)
+		except (ValueError, TypeError):
+			pass
+	return decoded
 
-def read_lines_zst(file_name):
-	with open(file_name, 'rb') as file_handle:
-		buffer = ''
-		reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(file_handle)
-		while True:
-			chunk = read_and_decode(reader, 2**27, (2**29) * 2)
 
-			if not chunk:
-				break
-			lines = (buffer + chunk).split("\n")
+class IdTimestampSink(Sink):
+	"""
+	Stores the created_utc of every post in the SQLite table post_ts (id INTEGER PRIMARY KEY, created_utc INTEGER),
+	keyed by the base36 decoded post ID. Each monthly file is bulk loaded in batches of batch_size rows,
+	sorted by ID, inside a single transaction.
+	"""
 
-			for line in lines[:-1]:
-				yield line.strip(), file_handle.tell()
+	def __init__(self, db_path="data/timestamps.db", batch_size=2**20):
+		self.db_path = db_path
+		self.batch_size = batch_size
+		self.ids = array('q')
+		self.created = array('q')
+		self.conn = None
+		self.inserted = 0
 
-			buffer = lines[-1]
+	def config(self):
+		return {"sink": type(self).__name__, "db_path": self.db_path, "table": "post_ts"}
 
-		reader.close()
+	def open(self, checkpoint=None):
+		# Init DB, rows of a month interrupted before its commit are simply inserted again
+		self.conn = sqlite3.connect(self.db_path)
+		self.conn.execute("PRAGMA journal_mode=WAL")
+		# The DB can be rebuilt from the dumps, no need to wait for the disk during the build
+		self.conn.execute("PRAGMA synchronous=OFF")
+		self.conn.execute("PRAGMA cache_size=-1048576")
+		self.conn.execute("PRAGMA temp_store=MEMORY")
+		self.conn.execute("CREATE TABLE IF NOT EXISTS post_ts (id INTEGER PRIMARY KEY, created_utc INTEGER NOT NULL)")
+		self.inserted = checkpoint["rows"] if checkpoint is not None else 0
 
-# Build the ID to Timestamp database
-def build_id_timestamp_db():
-	# Init DB
-	conn = sqlite3.connect("data/timestamps.db")
-	cur = conn.cursor()
-	cur.execute("CREATE TABLE IF NOT EXISTS ts (id TEXT PRIMARY KEY, ts TEXT)")
+	def process(self, obj):
+		self.ids.append(post_id_to_int(obj['id']))
+		self.created.append(int(obj['created_utc']))
 
-	# Gather input files
-	input_folder = "data/RedditDataset/reddit/submissions/"
-	input_files = []
-	total_size = 0
-	for subdir, dirs, files in os.walk(input_folder):
-		for filename in files:
-			input_path = os.path.join(subdir, filename)
-			if input_path.endswith(".zst"):
-				file_size = os.stat(input_path).st_size
-				total_size += file_size
-				input_files.append([input_path, file_size])
-				
-	# Sort input files to process older files first
-	input_files.sort(key=lambda x: (int(os.path.basename(x[0]).split('_')[1].split('-')[0]), int(os.path.basename(x[0]).split('_')[1].split('-')[1].split('.')[0])))
-
-	log.info(f"Processing {len(input_files)} files of {(total_size / (2**30)):.2f} gigabytes")
-
-	total_lines = 0
-	total_bytes_processed = 0
-
-	for input_file in input_files:
-		file_lines = 0
-		file_bytes_processed = 0
-		created = None
-		for line, file_bytes_processed in read_lines_zst(input_file[0]):
-			obj = json.loads(line)
-			created = datetime.fromtimestamp(int(obj['created_utc']), UTC)
-			created_str = created.strftime('%Y-%m-%d %H:%M:%S')
-			id = obj['id']
-			# Insert into DB
-			cur.execute("INSERT OR REPLACE INTO ts (id, ts) VALUES (?, ?)", (id, created_str))
-		
-			file_lines += 1
-			if file_lines == 1:
-				log.info(f"{created_str} : {file_lines + total_lines:,} : 0% : {(total_bytes_processed / total_size) * 100:.0f}%")
-			if file_lines % 100000 == 0:
-				log.info(f"{created_str} : {file_lines + total_lines:,} : {(file_bytes_processed / input_file[1]) * 100:.0f}% : {(total_bytes_processed / total_size) * 100:.0f}%")
-		total_lines += file_lines
-		total_bytes_processed += input_file[1]
-		log.info(f"{created_str} : {total_lines:,} : 100% : {(total_bytes_processed / total_size) * 100:.0f}%")
-		conn.commit()
-		
+	def flush(self, input_file):
+		# Arrays of int64 are much smaller to send back from a worker than tuples of strings
+		rows = self.ids, self.created
+		self.ids = array('q')
+		self.created = array('q')
+		return rows
+
+	def merge(self, rows):
+		# Rows sorted by ID append to the B-tree instead of inserting all over it
+		ids = np.frombuffer(rows[0], dtype=np.int64)
+		created = np.frombuffer(rows[1], dtype=np.int64)
+		order = np.argsort(ids, kind='stable')
+		ids = ids[order]
+		created = created[order]
+		# Insert into DB, one transaction per monthly file, only one batch of Python ints at a time
+		for start in range(0, len(ids), self.batch_size):
+			end = start + self.batch_size
+			self.conn.executemany("INSERT OR REPLACE INTO post_ts (id, created_utc) VALUES (?, ?)", zip(ids[start:end].tolist(), created[start:end].tolist()))
+		self.conn.commit()
+		self.inserted += len(ids)
+
+	def checkpoint(self):
+		return {"rows": self.inserted}
+
+	def close(self):
+		self.conn.execute("PRAGMA synchronous=NORMAL")
+		self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+		self.conn.close()
+
+class IdTimestampArraySink(IdTimestampSink):
+	"""
+	Alternative to the SQLite table: two .npy arrays, <array_path>_ids.npy with the sorted base36 decoded
+	post IDs and <array_path>_created_utc.npy with the matching timestamps, read with PostTimestampIndex.
+
+	The rows are appended unsorted to two raw int64 files (<array_path>_ids.bin, <array_path>_created_utc.bin)
+	kept to resume or extend the build, the arrays are sorted from them in close() unless <array_path>_built.json
+	says they were already built from all the staged rows.
+	"""
+
+	def __init__(self, array_path="data/timestamps"):
+		super().__init__()
+		self.array_path = array_path
+		self.new_build = True
+		self.staging_files = None
+
+	def config(self):
+		return {"sink": type(self).__name__, "array_path": self.array_path}
+
+	def open(self, checkpoint=None):
+		self.inserted = checkpoint["rows"] if checkpoint is not None else 0
+		self.new_build = checkpoint is None
+		# The staging files are only opened by the first merge, a scan without new rows leaves them and the arrays as they are
+		self.staging_files = None
+
+	def open_staging_files(self):
+		if self.new_build and os.path.exists(f"{self.array_path}_built.json"):
+			# A new build sorts the arrays again
+			os.remove(f"{self.array_path}_built.json")
+		self.staging_files = []
+		for name in ("ids", "created_utc"):
+			staging_path = f"{self.array_path}_{name}.bin"
+			staging_file = open(staging_path, "r+b" if os.path.exists(staging_path) else "w+b")
+			# Drop the rows appended after the checkpoint, or all of them for a new build
+			staging_file.truncate(self.inserted * 8)
+			staging_file.seek(0, os.SEEK_END)
+			self.staging_files.append(staging_file)
+
+	def merge(self, rows):
+		if self.staging_files is None:
+			self.open_staging_files()
+		for staging_file, values in zip(self.staging_files, rows):
+			values.tofile(staging_file)
+			staging_file.flush()
+		self.inserted += len(rows[0])
+
+	def built_rows(self):
+		# Number of staged rows the current .npy arrays were sorted from
+		built_path = f"{self.array_path}_built.json"
+		if not all(os.path.exists(f"{self.array_path}_{name}.npy") for name in ("ids", "created_utc")) or not os.path.exists(built_path):
+			return None
+		with open(built_path, "r", encoding='utf-8') as built_file:
+			return json.load(built_file)["rows"]
+
+	def close(self):
+		for staging_file in self.staging_files or []:
+			staging_file.close()
+		# Arrays are never replaced by the result of an empty scan
+		if self.inserted == 0:
+			log.info(f"No rows staged, {self.array_path}_*.npy left as they are")
+			return
+		if self.built_rows() == self.inserted:
+			log.info(f"{self.array_path}_*.npy are up to date")
+			return
+
+		# Rows staged after the checkpoint by an interrupted run are ignored
+		ids = np.memmap(f"{self.array_path}_ids.bin", dtype=np.int64, mode='r', shape=(self.inserted,))
+		created = np.memmap(f"{self.array_path}_created_utc.bin", dtype=np.int64, mode='r', shape=(self.inserted,))
+
+		# IDs grow over time so the stable sort is mostly merging runs, for duplicated IDs the last row wins like with INSERT OR REPLACE
+		order = np.argsort(ids, kind='stable')
+		sorted_ids = ids[order]
+		keep = np.ones(len(sorted_ids), dtype=bool)
+		keep[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+		order = order[keep]
+		log.info(f"Writing {len(order):,} sorted timestamps to {self.array_path}_*.npy")
+
+		for name, values in (("ids", sorted_ids[keep]), ("created_utc", created[order])):
+			tmp_path = f"{self.array_path}_{name}.tmp.npy"
+			np.save(tmp_path, values)
+			os.replace(tmp_path, f"{self.array_path}_{name}.npy")
+		with open(f"{self.array_path}_built.json", "w", encoding='utf-8') as built_file:
+			json.dump({"rows": self.inserted}, built_file)
+
+
+class PostTimestampIndex():
+	"""Read-only post ID -> created_utc lookups on the memory-mapped arrays written by IdTimestampArraySink"""
+
+	def __init__(self, array_path="data/timestamps"):
+		self.ids = np.load(f"{array_path}_ids.npy", mmap_mode='r')
+		self.created_utc = np.load(f"{array_path}_created_utc.npy", mmap_mode='r')
+
+	def __len__(self):
+		return len(self.ids)
+
+	def lookup(self, post_ids):
+		""" Batch lookup with a vectorized binary search
+
+		Args:
+			post_ids (array): base36 decoded post IDs
+		Returns:
+			created_utc (np.ndarray): int64 timestamps, -1 for unknown IDs
+		"""
+		post_ids = np.asarray(post_ids, dtype=np.int64)
+		if len(self.ids) == 0:
+			return np.full(post_ids.shape, -1, dtype=np.int64)
+		positions = np.minimum(np.searchsorted(self.ids, post_ids), len(self.ids) - 1)
+		found = self.ids[positions] == post_ids
+		return np.where(found, self.created_utc[positions], -1)
+
+
+def lookup_post_timestamps(post_ids, backend="sqlite", db_path="data/timestamps.db", array_path="data/timestamps"):
+	""" Batch lookup of post timestamps in the index built by build_id_timestamp_db
+
+	Args:
+		post_ids (array): base36 decoded post IDs
+		backend (str): "sqlite" joins a temporary table of the IDs with post_ts, "npy" searches the sorted arrays
+	Returns:
+		created_utc (np.ndarray): int64 timestamps, -1 for unknown IDs
+	"""
+	post_ids = np.asarray(post_ids, dtype=np.int64)
+	if backend == "npy":
+		return PostTimestampIndex(array_path).lookup(post_ids)
+
+	conn = sqlite3.connect(db_path)
+	conn.execute("CREATE TEMP TABLE query_ids (id INTEGER PRIMARY KEY)")
+	conn.executemany("INSERT OR IGNORE INTO query_ids (id) VALUES (?)", ((post_id,) for post_id in post_ids.tolist()))
+	found = pd.Series(dict(conn.execute("SELECT query_ids.id, post_ts.created_utc FROM query_ids JOIN post_ts ON post_ts.id = query_ids.id")), dtype=np.int64)
 	conn.close()
-	log.info(f"Total: {total_lines}")
+	return pd.Series(post_ids).map(found).fillna(-1).to_numpy(np.int64)
+
+
+def timestamp_index_exists(backend="sqlite", db_path="data/timestamps.db", array_path="data/timestamps"):
+	"""Whether the index lookup_post_timestamps reads with this backend was built"""
+	if backend == "npy":
+		return all(os.path.exists(f"{array_path}_{name}.npy") for name in ("ids", "created_utc"))
+	return os.path.exists(db_path)
+
+
+# Build the ID to Timestamp database, backend "sqlite" (data/timestamps.db) or "npy" (data/timestamps_*.npy)
+def build_id_timestamp_db(workers=1, resume=False, backend="sqlite"):
+	# Gather input files
+	input_files, total_size = get_input_files()
+	if not input_files:
+		raise FileNotFoundError(f"No monthly dumps found in {input_folder}")
+	if backend == "sqlite":
+		sink = IdTimestampSink()
+		manifest_path = f"{sink.db_path}.manifest.json"
+	elif backend == "npy":
+		sink = IdTimestampArraySink()
+		manifest_path = f"{sink.array_path}.manifest.json"
+	else:
+		raise ValueError("backend should be sqlite or npy")
+	# Monthly files are decoded in parallel with workers > 1, the DB is only written from this process in chronological order
+	scan_submissions(input_files, [sink], workers, manifest_path=manifest_path, resume=resume)
 
 if __name__ == '__main__':
-	build_id_timestamp_db()
+	parser = argparse.ArgumentParser("build_id_timestamp_db")
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('-r', '--resume', help="Continue an interrupted build", action='store_true')
+	parser.add_argument('-b', '--backend', choices=["sqlite", "npy"], default="sqlite", help="SQLite table or sorted memory-mapped arrays")
+	args = parser.parse_args()
 
+	build_id_timestamp_db(workers=args.workers, resume=args.resume, backend=args.backend)
@@ -1,39 +1,47 @@
+import argparse
 import pandas as pd
-import zstandard as zstd
-import csv
-import sqlite3
-from build_id_timestamp_db import build_hyperlink_data_db
+from build_id_timestamp_db import build_id_timestamp_db, post_ids_to_int, lookup_post_timestamps, timestamp_index_exists
 
 # If len(id) != 6 remove last character (Some IDs have an extra 's' at the end and in our datset all IDs have length 6) 
 # Timestamps seem quite inaccurate, we should replace them using the post IDs to fetch accurate timestamps from the new dataset
-def clean_hyperlink_data():
-    build_hyperlink_data_db()
-
-    conn = sqlite3.connect("data/timestamps.db")
-    cur = conn.cursor()
+def clean_hyperlink_chunk(data, backend="sqlite"):
+    post_ids = data['POST_ID']
+    data['POST_ID'] = post_ids.where(post_ids.str.len() == 6, post_ids.str[:-1])
+
+    # Every distinct ID is decoded and looked up once, in a single batch
+    codes, unique_ids = pd.factorize(data['POST_ID'])
+    created = lookup_post_timestamps(post_ids_to_int(unique_ids), backend)[codes]
+    created[codes == -1] = -1
+
+    found = created >= 0
+    data.loc[found, 'TIMESTAMP'] = pd.to_datetime(created[found], unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    return data
+
+# backend is the timestamp index to use, "sqlite" (data/timestamps.db) or "npy" (data/timestamps_*.npy)
+# With chunk_size the TSVs are streamed chunk_size rows at a time instead of being loaded whole, the output is the same
+# The index is only read, it is built first if it does not exist yet or with build_index (monthly files missing from it)
+def clean_hyperlink_data(backend="sqlite", chunk_size=None, build_index=False):
+    if build_index or not timestamp_index_exists(backend):
+        build_id_timestamp_db(resume=True, backend=backend)
 
     paths = [["data/soc-redditHyperlinks-title.tsv", "data/soc-redditHyperlinks-title-cleaned.tsv"], ["data/soc-redditHyperlinks-body.tsv", "data/soc-redditHyperlinks-body-cleaned.tsv"]]
 
     for in_path, out_path in paths:
-        data = pd.read_csv(in_path, sep='\t', header=0)
-        data['POST_ID'] = data['POST_ID'].apply(lambda x: x[:-1] if len(str(x)) != 6 else x)
-
-        def _fetch_ts(row):
-            cur.execute("SELECT ts FROM ts WHERE id=?", (row["POST_ID"],))
-            rec = cur.fetchone()
-            if rec:
-                row["TIMESTAMP"] = rec[0]
-            return row
-
-        data = data.apply(_fetch_ts, axis=1)
+        if chunk_size is None:
+            data = pd.read_csv(in_path, sep='\t', header=0, dtype={'POST_ID': str})
+            clean_hyperlink_chunk(data, backend).to_csv(out_path, sep="\t")
+            continue
 
-        data.to_csv(out_path, sep="\t")
-    
-    cur.execute("DROP TABLE IF EXISTS ts")
-    conn.close()
+        # The index of the chunks carries on from one chunk to the next, as in the single pass output
+        with pd.read_csv(in_path, sep='\t', header=0, dtype={'POST_ID': str}, chunksize=chunk_size) as reader:
+            for i, data in enumerate(reader):
+                clean_hyperlink_chunk(data, backend).to_csv(out_path, sep="\t", mode='w' if i == 0 else 'a', header=i == 0)
 
 if __name__ == '__main__':
-    clean_hyperlink_data()
-
-
+    parser = argparse.ArgumentParser("hyperlink_data_cleanup")
+    parser.add_argument('-b', '--backend', choices=["sqlite", "npy"], default="sqlite", help="Timestamp index to use")
+    parser.add_argument('-c', '--chunk_size', type=int, help="Stream the TSVs this many rows at a time to bound memory use", required=False)
+    parser.add_argument('-i', '--build_index', help="Add the monthly files missing from the timestamp index before cleaning", action='store_true')
+    args = parser.parse_args()
 
+    clean_hyperlink_data(backend=args.backend, chunk_size=args.chunk_size, build_index=args.build_index)
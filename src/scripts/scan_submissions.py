@@ -0,0 +1,46 @@
+# Builds the outputs of zst_to_gamergate_csv, zst_posts_per_day_per_sub, build_id_timestamp_db, activity_cube and zst_to_text_corpus
+# with a single decompression and parsing pass over the submissions dump
+
+import logging.handlers
+import argparse
+from zst_utils import get_input_files, scan_submissions, json_backends
+from zst_to_gamergate_csv import GamergateCsvSink, gamergate_subs
+from zst_posts_per_day_per_sub import PostsPerDaySink
+from build_id_timestamp_db import IdTimestampSink
+from activity_cube import ActivityCubeSink
+from zst_to_text_corpus import TextCorpusSink
+
+
+log = logging.getLogger("bot")
+
+if __name__ == '__main__':
+	# Parse arguments
+	parser = argparse.ArgumentParser("scan_submissions")
+	parser.add_argument('-l', '--subreddit_list', nargs='+', help='List of subreddits for the post CSV and the text documents', required=False)
+	parser.add_argument('--posts_csv', help="Output path of the post CSV", type=str, default="data/gamergate_post_data.csv")
+	parser.add_argument('--posts_per_day_csv', help="Output path of the posts per day CSV", type=str, default="data/zst_posts_per_day_per_sub.csv")
+	parser.add_argument('--timestamps_db', help="Output path of the ID to timestamp DB", type=str, default="data/timestamps.db")
+	parser.add_argument('--activity_cube', help="Directory of the daily activity cube", type=str, default="data/activity_cube")
+	parser.add_argument('--text_corpus', help="Folder of the monthly text documents", type=str, default="outputs/subreddit_text_documents_monthly")
+	parser.add_argument('--skip', nargs='+', choices=["posts", "posts_per_day", "timestamps", "activity_cube", "text_corpus"], default=[], help="Outputs not to build")
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('--manifest', help="Record of the files done", type=str, default="data/scan_submissions.manifest.json")
+	parser.add_argument('-r', '--resume', help="Continue an interrupted scan", action='store_true')
+	parser.add_argument('--json_backend', choices=json_backends, help="JSON parser, the fastest installed one by default", required=False)
+	args = parser.parse_args()
+
+	sinks = []
+	if "posts" not in args.skip:
+		sinks.append(GamergateCsvSink(subs=args.subreddit_list or gamergate_subs, output_file_path=args.posts_csv))
+	if "posts_per_day" not in args.skip:
+		sinks.append(PostsPerDaySink(output_file_path=args.posts_per_day_csv))
+	if "timestamps" not in args.skip:
+		sinks.append(IdTimestampSink(db_path=args.timestamps_db))
+	if "activity_cube" not in args.skip:
+		sinks.append(ActivityCubeSink(cube_path=args.activity_cube))
+	if "text_corpus" not in args.skip:
+		sinks.append(TextCorpusSink(subs=args.subreddit_list or gamergate_subs, output_folder=args.text_corpus))
+
+	input_files, total_size = get_input_files()
+	scan_submissions(input_files, sinks, workers=args.workers, json_backend=args.json_backend,
+				  manifest_path=args.manifest, resume=args.resume)
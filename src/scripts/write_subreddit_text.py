@@ -1,75 +1,169 @@
+import numpy as np
 import pandas as pd
 import os
-
-def write_subreddit_text_document():
-
-    df = pd.read_csv("data/politics_post_data.csv")
+import argparse
+from zst_utils import imap_ordered
+
+text_columns = ["TIMESTAMP", "SUBREDDIT", "TITLE", "BODY_TEXT"]
+
+def read_text_post_data(data_path, columns=text_columns, subreddits=None, from_date=None, to_date=None):
+    """ Read the posts to write as text documents, with the folder detection and filters of
+    read_post_data in src/data/some_dataloader.py (which is not importable from the scripts)
+
+    Args:
+        data_path (str): CSV file or folder of Parquet / Arrow IPC files written by zst_to_gamergate_csv,
+            possibly partitioned in subreddit=<name>/year_month=<YYYY-MM>/ folders
+        subreddits (list): only read the posts of these subreddits, all of them if None
+        from_date (str): 'YYYY-MM-DD' only read the posts from this date (included)
+        to_date (str): 'YYYY-MM-DD' only read the posts before this date (excluded)
+    Returns:
+        df (df): posts with a datetime 'TIMESTAMP' column
+    """
+    if os.path.isdir(data_path):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        entries = os.listdir(data_path)
+        partitioned = any(entry.startswith("subreddit=") for entry in entries)
+        if partitioned:
+            partitioning = ds.partitioning(pa.schema([("subreddit", pa.string()), ("year_month", pa.string())]), flavor="hive")
+            data_format = "ipc" if any(f.endswith(".arrow") for _, _, files in os.walk(data_path) for f in files) else "parquet"
+        else:
+            partitioning = None
+            data_format = "ipc" if any(f.endswith(".arrow") for f in entries) else "parquet"
+        dataset = ds.dataset(data_path, format=data_format, partitioning=partitioning)
+
+        # Filters on the partition fields skip the other folders without opening their files
+        filters = []
+        if subreddits is not None:
+            filters.append(ds.field("subreddit" if partitioned else "SUBREDDIT").isin(list(subreddits)))
+        if from_date is not None:
+            if partitioned:
+                filters.append(ds.field("year_month") >= from_date[:7])
+            filters.append(ds.field("TIMESTAMP") >= pd.Timestamp(from_date).to_pydatetime())
+        if to_date is not None:
+            if partitioned:
+                filters.append(ds.field("year_month") <= to_date[:7])
+            filters.append(ds.field("TIMESTAMP") < pd.Timestamp(to_date).to_pydatetime())
+        expression = None
+        for f in filters:
+            expression = f if expression is None else expression & f
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    df = pd.read_csv(data_path, usecols=columns)
+    if 'TIMESTAMP' in df.columns:
+        df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], errors='coerce')
+    if subreddits is not None:
+        df = df[df['SUBREDDIT'].isin(subreddits)]
+    if from_date is not None:
+        df = df[df['TIMESTAMP'] >= from_date]
+    if to_date is not None:
+        df = df[df['TIMESTAMP'] < to_date]
+    return df
+
+# "TITLE\nBODY_TEXT" block of every post
+def get_text_blocks(df):
+    return (df['TITLE'].fillna("").astype(str) + "\n" + df['BODY_TEXT'].fillna("").astype(str)).to_numpy(dtype=object)
+
+def get_document_groups(df, keys):
+    """ Groups of posts with the same keys, found in a single sorted pass
+
+    Args:
+        df (df): posts with a TITLE, a BODY_TEXT and the keys columns
+        keys (list): columns identifying a document, e.g. ['SUBREDDIT', 'YEAR_MONTH']
+    Returns:
+        df (df): the posts sorted by keys, the posts of a group keep their order
+        groups (list): (key values, start, end) of every group, rows start:end of the sorted df
+    """
+    # The stable sort keeps the posts of a group in order, groups start where one of the keys changes
+    df = df.dropna(subset=keys).sort_values(keys, kind='stable')
+    if len(df) == 0:
+        return df, []
+    key_values = [df[key].to_numpy(dtype=object) for key in keys]
+    changes = np.zeros(len(df), dtype=bool)
+    changes[0] = True
+    for values in key_values:
+        changes[1:] |= values[1:] != values[:-1]
+    starts = np.flatnonzero(changes)
+    ends = np.append(starts[1:], len(df))
+    return df, [(tuple(values[start] for values in key_values), start, end) for start, end in zip(starts, ends)]
+
+def iter_documents(df, keys):
+    """ Text documents of the groups of posts with the same keys (see get_document_groups)
+
+    Yields:
+        key_values (tuple): values of the keys, in sorted order
+        text (str): blocks of the posts of the group, in their order in df, separated by newlines
+    """
+    df, groups = get_document_groups(df, keys)
+    blocks = get_text_blocks(df)
+    for key_values, start, end in groups:
+        yield key_values, "\n".join(blocks[start:end])
+
+def _write_document(document):
+    file_path, posts = document
+    return _write_document_text(file_path, "\n".join(get_text_blocks(posts)))
+
+def _write_document_text(file_path, final_text):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Write to file
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(final_text)
+    return file_path
+
+def write_documents(df, keys, get_file_path, workers=1):
+    """ Write the text document of every group of posts with the same keys
+
+    Args:
+        get_file_path (callable): path of the document of some key values
+        workers (int): number of processes building and writing documents, each one only receives
+            the TITLE and BODY_TEXT rows of the documents it writes
+    Yields:
+        file_path (str): documents written, in sorted order
+    """
+    if workers <= 1:
+        for key_values, final_text in iter_documents(df, keys):
+            yield _write_document_text(get_file_path(*key_values), final_text)
+        return
+
+    df, groups = get_document_groups(df, keys)
+    posts = df[['TITLE', 'BODY_TEXT']]
+    documents = ((get_file_path(*key_values), posts.iloc[start:end]) for key_values, start, end in groups)
+    yield from imap_ordered(_write_document, documents, workers)
+
+def write_subreddit_text_document(data_path="data/politics_post_data.csv", subreddits=None, workers=1, from_date=None, to_date=None):
+
+    df = read_text_post_data(data_path, subreddits=subreddits, from_date=from_date, to_date=to_date)
     
     output_folder = "outputs/subreddit_text_politics"
     os.makedirs(output_folder, exist_ok=True)
 
-    df['TITLE'] = df['TITLE'].fillna("")
-    df['BODY_TEXT'] = df['BODY_TEXT'].fillna("")
-
-    # Group by subreddit
-    for subreddit, group in df.groupby('SUBREDDIT'):
-
-        combined_text = []
-        
-        for _, row in group.iterrows():
-            text_block = f"{row['TITLE']}\n{row['BODY_TEXT']}"
-            combined_text.append(text_block)
-        
-        final_text = "\n".join(combined_text)
-        
-        file_path = os.path.join(output_folder, f"{subreddit}.txt")
-        
-        # Write to file
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(final_text)
-
-        print('Text file for:', subreddit, 'created.')
+    # With workers > 1 the documents are built and written in parallel
+    for file_path in write_documents(df, ['SUBREDDIT'], lambda subreddit: os.path.join(output_folder, f"{subreddit}.txt"), workers):
+        print('Text file for:', os.path.basename(file_path)[:-len(".txt")], 'created.')
 
     print("All text files created in:", output_folder)
 
-def write_subreddit_monthly_text_documents():
-
-    df = pd.read_csv("data/gamergate_post_data.csv")
+def write_subreddit_monthly_text_documents(data_path="data/gamergate_post_data.csv", subreddits=None, workers=1, from_date=None, to_date=None):
 
-    df['TIMESTAMP'] = pd.to_datetime(df['TIMESTAMP'], errors='coerce')
-
-    df['TITLE'] = df['TITLE'].fillna("")
-    df['BODY_TEXT'] = df['BODY_TEXT'].fillna("")
+    df = read_text_post_data(data_path, subreddits=subreddits, from_date=from_date, to_date=to_date)
 
     df['YEAR_MONTH'] = df['TIMESTAMP'].dt.to_period('M').astype(str)
 
     output_folder = "outputs/subreddit_text_documents_monthly"
     os.makedirs(output_folder, exist_ok=True)
 
-    for subreddit, sub_group in df.groupby('SUBREDDIT'):
-        for year_month, month_group in sub_group.groupby('YEAR_MONTH'):
-
-            combined_text = []
-
-            for _, row in month_group.iterrows():
-                text_block = f"{row['TITLE']}\n{row['BODY_TEXT']}"
-                combined_text.append(text_block)
-
-            final_text = "\n".join(combined_text)
-
-            sub_folder = os.path.join(output_folder, subreddit)
-            os.makedirs(sub_folder, exist_ok=True)
-
-            file_path = os.path.join(sub_folder, f"{subreddit}_{year_month}.txt")
-
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(final_text)
-
-            print(f"Created: {file_path}")
+    # Every (subreddit, month) document in one pass over the data sorted by subreddit and month
+    get_file_path = lambda subreddit, year_month: os.path.join(output_folder, subreddit, f"{subreddit}_{year_month}.txt")
+    for file_path in write_documents(df, ['SUBREDDIT', 'YEAR_MONTH'], get_file_path, workers):
+        print(f"Created: {file_path}")
 
     print("All monthly subreddit text files created in:", output_folder)
 
 if __name__ == '__main__':
-    write_subreddit_text_document()
+    parser = argparse.ArgumentParser("write_subreddit_text")
+    parser.add_argument('-w', '--workers', help="Number of processes writing documents", type=int, default=1)
+    args = parser.parse_args()
+
+    write_subreddit_text_document(workers=args.workers)
     #write_subreddit_monthly_text_documents()
      
\ No newline at end of file
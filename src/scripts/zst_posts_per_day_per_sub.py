@@ -1,120 +1,92 @@
 # SOURCE: https://github.com/Watchful1/PushshiftDumps/blob/master/scripts/iterate_folder.py
 # Modified by Robin
 
-import zstandard
 import os
-import json
-import sys
-from datetime import datetime, UTC
 import logging.handlers
 import csv
+import argparse
+from array import array
+import numpy as np
+from zst_utils import Sink, get_input_files, get_subreddit, scan_submissions
 
 
 log = logging.getLogger("bot")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
-
-
-def read_and_decode(reader, chunk_size, max_window_size, previous_chunk=None, bytes_read=0):
-	chunk = reader.read(chunk_size)
-	bytes_read += chunk_size
-	if previous_chunk is not None:
-		chunk = previous_chunk + chunk
-	try:
-		return chunk.decode()
-	except UnicodeDecodeError:
-		if bytes_read > max_window_size:
-			raise UnicodeError(f"Unable to decode frame after reading {bytes_read:,} bytes")
-		log.info(f"Decoding error with {bytes_read:,} bytes, reading another chunk")
-		return read_and_decode(reader, chunk_size, max_window_size, chunk, bytes_read)
-
-
-def read_lines_zst(file_name):
-	with open(file_name, 'rb') as file_handle:
-		buffer = ''
-		reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(file_handle)
-		while True:
-			chunk = read_and_decode(reader, 2**27, (2**29) * 2)
-
-			if not chunk:
-				break
-			lines = (buffer + chunk).split("\n")
-
-			for line in lines[:-1]:
-				yield line.strip(), file_handle.tell()
-
-			buffer = lines[-1]
-
-		reader.close()
-
-def build_posts_per_day_per_sub_csv():
-	output_file_path = "data/zst_posts_per_day_per_sub.csv"
-	# Init output file
-	with open(output_file_path, "w", encoding='utf-8', newline="") as output_file:
-		writer = csv.writer(output_file)
-		writer.writerow(["date", "subreddit", "post_count"])
-
-	input_folder = "data/RedditDataset/reddit/submissions/"
-	input_files = []
-	total_size = 0
-	for subdir, dirs, files in os.walk(input_folder):
-		for filename in files:
-			input_path = os.path.join(subdir, filename)
-			if input_path.endswith(".zst"):
-				file_size = os.stat(input_path).st_size
-				total_size += file_size
-				input_files.append([input_path, file_size])
-				
-	# Sort input files to process older files first
-	input_files.sort(key=lambda x: (int(os.path.basename(x[0]).split('_')[1].split('-')[0]), int(os.path.basename(x[0]).split('_')[1].split('-')[1].split('.')[0])))
-
-	log.info(f"Processing {len(input_files)} files of {(total_size / (2**30)):.2f} gigabytes")
-
-	total_lines = 0
-	total_bytes_processed = 0
-
-	# Variables for data, we need a two level dictionary: date -> subreddit -> count
-	mapped_data = {}
-
-	for input_file in input_files:
-		file_lines = 0
-		file_bytes_processed = 0
-		created = None
-		for line, file_bytes_processed in read_lines_zst(input_file[0]):
-			obj = json.loads(line)
-			created = datetime.fromtimestamp(int(obj['created_utc']), UTC)
-			created_str = created.strftime('%Y-%m-%d')
-			subreddit = None
-			if 'permalink' in obj:
-				subreddit = f"{obj['permalink'].split('/')[2].lower()}"
-			else:
-				subreddit = f"{obj['subreddit'].lower()}"
-			# Insert any processing logic here if needed
-			mapped_data.setdefault(created_str, {})
-			mapped_data[created_str].setdefault(subreddit, 0)
-			mapped_data[created_str][subreddit] += 1
-
-			file_lines += 1
-			if file_lines == 1:
-				log.info(f"{created_str} : {file_lines + total_lines:,} : 0% : {(total_bytes_processed / total_size) * 100:.0f}%")
-			if file_lines % 100000 == 0:
-				log.info(f"{created_str} : {file_lines + total_lines:,} : {(file_bytes_processed / input_file[1]) * 100:.0f}% : {(total_bytes_processed / total_size) * 100:.0f}%")
-		total_lines += file_lines
-		total_bytes_processed += input_file[1]
-		log.info(f"{created_str} : {total_lines:,} : 100% : {(total_bytes_processed / total_size) * 100:.0f}%")
-		# Write mapped data to CSV after each file to avoid memory issues
-		log.info(f"Saving mapped data to {output_file_path}")
-		with open(output_file_path, "a", encoding='utf-8', newline="") as output_file:
+
+
+class PostsPerDaySink(Sink):
+	"""
+	Counts the posts per day and subreddit, the counts are appended to the CSV after each monthly file.
+
+	Per post only an int64 key (subreddit ID << 16 | days since 1970-01-01) is appended, subreddit names are
+	interned to IDs as they are first seen. The keys are counted with numpy at the end of the file and dates
+	are only formatted when writing, rows keep the order in which dates and subreddits first appear in the file.
+	"""
+
+	def __init__(self, output_file_path="data/zst_posts_per_day_per_sub.csv"):
+		self.output_file_path = output_file_path
+		self.rows = 0
+		self.subreddit_ids = {}
+		self.keys = array('q')
+
+	def config(self):
+		return {"sink": type(self).__name__, "output_file_path": self.output_file_path}
+
+	def open(self, checkpoint=None):
+		if checkpoint is not None:
+			# Drop the rows written after the checkpoint
+			os.truncate(self.output_file_path, checkpoint["output_bytes"])
+			self.rows = checkpoint["rows"]
+			return
+		# Init output file
+		with open(self.output_file_path, "w", encoding='utf-8', newline="") as output_file:
 			writer = csv.writer(output_file)
-			for date, subreddits in mapped_data.items():
-				for subreddit, count in subreddits.items():
-					writer.writerow([date, subreddit, count])
-		log.info(f"Saved mapped data to {output_file_path}")
-		mapped_data = {}  # Clear mapped data to free memory
-		
+			writer.writerow(["date", "subreddit", "post_count"])
+
+	def process(self, obj):
+		subreddit = get_subreddit(obj)
+		subreddit_id = self.subreddit_ids.get(subreddit)
+		if subreddit_id is None:
+			subreddit_id = self.subreddit_ids[subreddit] = len(self.subreddit_ids)
+		self.keys.append(subreddit_id << 16 | int(obj['created_utc']) // 86400)
+
+	def flush(self, input_file):
+		keys = np.frombuffer(self.keys, dtype=np.int64)
+		subreddits = list(self.subreddit_ids)
+		self.subreddit_ids = {}
+		self.keys = array('q')
+
+		keys, first_seen, counts = np.unique(keys, return_index=True, return_counts=True)
+		days = keys & 0xFFFF
+		# Dates in order of first post, then subreddits in order of first post that day
+		unique_days, day_codes = np.unique(days, return_inverse=True)
+		day_first_seen = np.full(len(unique_days), np.iinfo(np.int64).max)
+		np.minimum.at(day_first_seen, day_codes, first_seen)
+		order = np.lexsort((first_seen, day_first_seen[day_codes]))
+		return subreddits, days[order], keys[order] >> 16, counts[order]
+
+	def merge(self, result):
+		subreddits, days, subreddit_ids, counts = result
+		dates = days.astype('datetime64[D]').astype(str)
+		# Write the counts to CSV after each file to avoid memory issues
+		with open(self.output_file_path, "a", encoding='utf-8', newline="") as output_file:
+			writer = csv.writer(output_file)
+			writer.writerows(zip(dates.tolist(), [subreddits[subreddit_id] for subreddit_id in subreddit_ids.tolist()], counts.tolist()))
+		self.rows += len(counts)
+		log.info(f"Saved mapped data to {self.output_file_path}")
+
+	def checkpoint(self):
+		return {"output_bytes": os.path.getsize(self.output_file_path), "rows": self.rows}
 
-	log.info(f"Total: {total_lines}")
+# Monthly files are counted in parallel with workers > 1, the counts are still written in chronological order
+def build_posts_per_day_per_sub_csv(workers=1, resume=False):
+	input_files, total_size = get_input_files()
+	sink = PostsPerDaySink()
+	scan_submissions(input_files, [sink], workers, manifest_path=f"{sink.output_file_path}.manifest.json", resume=resume)
 
 if __name__ == '__main__':
-	build_posts_per_day_per_sub_csv()
+	parser = argparse.ArgumentParser("zst_posts_per_day_per_sub")
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('-r', '--resume', help="Continue an interrupted run", action='store_true')
+	args = parser.parse_args()
 
+	build_posts_per_day_per_sub_csv(workers=args.workers, resume=args.resume)
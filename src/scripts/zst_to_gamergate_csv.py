@@ -1,19 +1,21 @@
 # SOURCE: https://github.com/Watchful1/PushshiftDumps/blob/master/scripts/iterate_folder.py
 # Modified by Robin
 
-import zstandard
 import os
+import io
+import re
 import json
-import sys
 from datetime import datetime, UTC
 import logging.handlers
 import csv
 import argparse
+import glob
+import shutil
+import zstandard
+from zst_utils import Sink, get_input_files, get_subreddit, scan_submissions
 
 
 log = logging.getLogger("bot")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
 
 # These are the subreddits related to gamergate
 gamergate_subs = {
@@ -36,112 +38,418 @@ gamergate_subs = {
 		"the_donald",
     }
 
-def read_and_decode(reader, chunk_size, max_window_size, previous_chunk=None, bytes_read=0):
-	chunk = reader.read(chunk_size)
-	bytes_read += chunk_size
-	if previous_chunk is not None:
-		chunk = previous_chunk + chunk
-	try:
-		return chunk.decode()
-	except UnicodeDecodeError:
-		if bytes_read > max_window_size:
-			raise UnicodeError(f"Unable to decode frame after reading {bytes_read:,} bytes")
-		log.info(f"Decoding error with {bytes_read:,} bytes, reading another chunk")
-		return read_and_decode(reader, chunk_size, max_window_size, chunk, bytes_read)
-
-
-def read_lines_zst(file_name):
-	with open(file_name, 'rb') as file_handle:
-		buffer = ''
-		reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(file_handle)
-		while True:
-			chunk = read_and_decode(reader, 2**27, (2**29) * 2)
-
-			if not chunk:
-				break
-			lines = (buffer + chunk).split("\n")
-
-			for line in lines[:-1]:
-				yield line.strip(), file_handle.tell()
-
-			buffer = lines[-1]
-
-		reader.close()
-
-def zst_to_gamer_gate_csv(subs=gamergate_subs, output_file_path="data/gamergate_post_data.csv"):
-	# Init output file
-	with open(output_file_path, "w", encoding='utf-8', newline="") as output_file:
-		writer = csv.writer(output_file)
-		writer.writerow(["TIMESTAMP", "SUBREDDIT", "USERNAME", "TITLE", "BODY_TEXT", "NUM_COMMENTS", "POST_ID"])
-
-		input_folder = "data/RedditDataset/reddit/submissions/"
-		input_files = []
-		total_size = 0
-		for subdir, dirs, files in os.walk(input_folder):
+post_columns = ["TIMESTAMP", "SUBREDDIT", "USERNAME", "TITLE", "BODY_TEXT", "NUM_COMMENTS", "POST_ID"]
+
+# Values of the post columns, the timestamp is still the unix time
+def get_post_fields(obj, subreddit_lower):
+	return [
+		int(obj['created_utc']),
+		subreddit_lower,
+		f"u/{obj['author']}",
+		obj['title'],
+		obj.get('selftext', ""),#[:32000] # remove first # if the subreddit has very large text posts and you want to open this in excel
+		obj['num_comments'],
+		obj['id'],
+	]
+
+def clean_text(value):
+	return str(value).encode("utf-8", errors='replace').decode()
+
+class RotatingOutput():
+	"""
+	Output file made of whole parts appended as bytes, e.g. the part of a monthly file written by a worker.
+
+	With compression_level the header and every part are written as separate zstd frames, a series of frames
+	being a valid .zst file, so that a checkpoint is still a byte offset in the output. With max_file_bytes
+	the output is rotated: <name>.0000.<ext>, <name>.0001.<ext>, ... a new file (with its own header)
+	being started when the current one reached max_file_bytes, parts are never split between files.
+	"""
+
+	def __init__(self, path, header="", compression_level=None, max_file_bytes=None):
+		self.path = path
+		self.header = header
+		self.compression_level = compression_level
+		self.max_file_bytes = max_file_bytes
+		self.output_file = None
+		self.files = 0
+		self.header_bytes = self.encode_header()
+
+	def encode_header(self):
+		header = self.header.encode("utf-8")
+		if header and self.compression_level is not None:
+			header = zstandard.ZstdCompressor(level=self.compression_level).compress(header)
+		return header
+
+	def file_path(self, index):
+		if self.max_file_bytes is None:
+			return self.path
+		directory, filename = os.path.split(self.path)
+		name, dot, extension = filename.partition(".")
+		return os.path.join(directory, f"{name}.{index:04d}{dot}{extension}")
+
+	def open(self, checkpoint=None):
+		if self.max_file_bytes is not None:
+			# Remove the files of a previous extraction, or the ones started after the checkpoint
+			index = checkpoint["files"] if checkpoint is not None else 0
+			while os.path.exists(self.file_path(index)):
+				os.remove(self.file_path(index))
+				index += 1
+		# Parts of a scan that stopped before merging them
+		for part_path in glob.glob(f"{glob.escape(self.path)}.*.part"):
+			os.remove(part_path)
+
+		if checkpoint is None:
+			self.new_file()
+			return
+		self.files = checkpoint["files"]
+		self.output_file = open(self.file_path(self.files - 1), "r+b")
+		# Drop whatever was written after the checkpoint, e.g. half of the month being merged when the scan stopped
+		self.output_file.truncate(checkpoint["output_bytes"])
+		self.output_file.seek(0, os.SEEK_END)
+
+	def new_file(self):
+		if self.output_file is not None:
+			self.output_file.close()
+		self.output_file = open(self.file_path(self.files), "w+b")
+		self.files += 1
+		self.output_file.write(self.header_bytes)
+
+	def open_part(self, name):
+		"""Part file <output>.<name>.part next to the output, returns its path and a text file to write it"""
+		part_path = f"{self.path}.{name}.part"
+		part_file = open(part_path, "wb")
+		if self.compression_level is not None:
+			part_file = zstandard.ZstdCompressor(level=self.compression_level).stream_writer(part_file)
+		return part_path, io.TextIOWrapper(part_file, encoding='utf-8', newline="")
+
+	def append(self, part_path):
+		# A file holds at least one part
+		if self.max_file_bytes is not None and self.output_file.tell() >= max(self.max_file_bytes, len(self.header_bytes) + 1):
+			self.new_file()
+		with open(part_path, "rb") as part_file:
+			shutil.copyfileobj(part_file, self.output_file)
+		os.remove(part_path)
+
+	def checkpoint(self):
+		self.output_file.flush()
+		return {"files": self.files, "output_bytes": self.output_file.tell()}
+
+	def close(self):
+		self.output_file.close()
+
+# data/posts.csv.zst -> data/posts_bodies.csv.zst
+def get_body_path(output_file_path):
+	directory, filename = os.path.split(output_file_path)
+	name, dot, extension = filename.partition(".")
+	return os.path.join(directory, f"{name}_bodies{dot}{extension}")
+
+class GamergateCsvSink(Sink):
+	"""
+	Writes the posts of the given subreddits to a CSV file, or a JSON lines file with output_format="jsonl".
+
+	compression_level writes a zstd compressed file instead and max_file_bytes rotates it in files of
+	about that size (see RotatingOutput). With split_bodies the BODY_TEXT column is moved to a side file
+	of POST_ID, BODY_TEXT rows (see get_body_path) so that reading the metadata never reads the text.
+	"""
+
+	def __init__(self, subs=gamergate_subs, output_file_path="data/gamergate_post_data.csv", output_format="csv",
+			  compression_level=None, max_file_bytes=None, split_bodies=False):
+		if output_format not in ("csv", "jsonl"):
+			raise ValueError("output_format should be csv or jsonl")
+		self.subs = subs
+		self.subreddits = {sub.lower() for sub in subs}
+		self.output_file_path = output_file_path
+		self.output_format = output_format
+		self.compression_level = compression_level
+		self.max_file_bytes = max_file_bytes
+		self.split_bodies = split_bodies
+
+		# Columns of each output
+		self.output_columns = [[column for column in post_columns if not (split_bodies and column == "BODY_TEXT")]]
+		output_paths = [output_file_path]
+		if split_bodies:
+			self.output_columns.append(["POST_ID", "BODY_TEXT"])
+			output_paths.append(get_body_path(output_file_path))
+		self.outputs = []
+		for output_path, columns in zip(output_paths, self.output_columns):
+			header = ""
+			if output_format == "csv":
+				header_buffer = io.StringIO(newline="")
+				csv.writer(header_buffer).writerow(columns)
+				header = header_buffer.getvalue()
+			self.outputs.append(RotatingOutput(output_path, header, compression_level, max_file_bytes))
+
+		self.parts = None
+		self.part_name = None
+		self.file_rows = 0
+		self.rows = 0
+
+	def config(self):
+		return {"sink": type(self).__name__, "output_file_path": self.output_file_path, "subs": sorted(self.subs), "output_format": self.output_format,
+		  "compression_level": self.compression_level, "max_file_bytes": self.max_file_bytes, "split_bodies": self.split_bodies}
+
+	def open(self, checkpoint=None):
+		self.rows = checkpoint["rows"] if checkpoint is not None else 0
+		for i, output in enumerate(self.outputs):
+			output.open(checkpoint["outputs"][i] if checkpoint is not None else None)
+
+	def start(self, input_file):
+		# RS_2014-09.zst -> RS_2014-09, the parts of a monthly file are named after it
+		self.part_name = os.path.basename(input_file[0]).split(".")[0]
+
+	def process(self, obj):
+		subreddit_lower = get_subreddit(obj)
+		if subreddit_lower not in self.subreddits:
+			return
+		self.add(obj, subreddit_lower)
+
+	def add(self, obj, subreddit_lower):
+		"""Write a post already known to be in one of the subreddits"""
+		# The posts of a monthly file are written to a part file next to each output
+		if self.parts is None:
+			self.parts = []
+			for output in self.outputs:
+				part_path, part_file = output.open_part(self.part_name)
+				self.parts.append((part_path, part_file, csv.writer(part_file) if self.output_format == "csv" else None))
+
+		output_obj = get_post_fields(obj, subreddit_lower)
+		output_obj[0] = datetime.fromtimestamp(output_obj[0], UTC).strftime("%Y-%m-%d %H:%M:%S")
+		if self.output_format == "csv":
+			values = dict(zip(post_columns, [clean_text(value) for value in output_obj]))
+		else:
+			values = {column: clean_text(value) if column != "NUM_COMMENTS" and value is not None else value for column, value in zip(post_columns, output_obj)}
+
+		for (part_path, part_file, writer), columns in zip(self.parts, self.output_columns):
+			if writer is not None:
+				writer.writerow([values[column] for column in columns])
+			else:
+				part_file.write(json.dumps({column: values[column] for column in columns}, ensure_ascii=False) + "\n")
+		self.file_rows += 1
+
+	def flush(self, input_file):
+		if self.parts is None:
+			return None, 0
+		for part_path, part_file, writer in self.parts:
+			part_file.close()
+		result = [part_path for part_path, part_file, writer in self.parts], self.file_rows
+		self.parts = None
+		self.file_rows = 0
+		return result
+
+	def merge(self, result):
+		part_paths, file_rows = result
+		if part_paths is None:
+			return
+		for output, part_path in zip(self.outputs, part_paths):
+			output.append(part_path)
+		self.rows += file_rows
+
+	def discard(self, result):
+		part_paths, file_rows = result
+		for part_path in part_paths or ():
+			if os.path.exists(part_path):
+				os.remove(part_path)
+
+	def checkpoint(self):
+		return {"outputs": [output.checkpoint() for output in self.outputs], "rows": self.rows}
+
+	def close(self):
+		for output in self.outputs:
+			output.close()
+
+class GamergateArrowSink(Sink):
+	"""
+	Writes the posts of the given subreddits to a folder with one Parquet (or Arrow IPC) file per monthly dump,
+	split in row groups (record batches) of row_group_size posts. Columns are typed: TIMESTAMP is a timestamp[s],
+	SUBREDDIT and USERNAME are dictionary encoded and NUM_COMMENTS is an int64.
+
+	With partitioned=True the files are split in a subreddit=<name>/year_month=<YYYY-MM>/ layout instead,
+	so that readers filtering on subreddit or time only open the matching folders.
+	"""
+
+	def __init__(self, subs=gamergate_subs, output_path="data/gamergate_post_data.parquet", output_format="parquet", row_group_size=2**17, partitioned=False):
+		if output_format not in ("parquet", "arrow"):
+			raise ValueError("output_format should be parquet or arrow")
+		self.subs = subs
+		self.subreddits = {sub.lower() for sub in subs}
+		self.output_path = output_path
+		self.output_format = output_format
+		self.row_group_size = row_group_size
+		self.partitioned = partitioned
+		self.columns = {column: [] for column in post_columns}
+		self.files = []
+		self.rows = 0
+
+	def config(self):
+		return {"sink": type(self).__name__, "output_path": self.output_path, "output_format": self.output_format,
+		  "partitioned": self.partitioned, "subs": sorted(self.subs)}
+
+	def open(self, checkpoint=None):
+		os.makedirs(self.output_path, exist_ok=True)
+		self.files = list(checkpoint["files"]) if checkpoint is not None else []
+		self.rows = checkpoint["rows"] if checkpoint is not None else 0
+		# Remove the files of a previous extraction, or the ones written after the checkpoint, other files are left alone
+		for subdir, dirs, files in os.walk(self.output_path, topdown=False):
 			for filename in files:
-				input_path = os.path.join(subdir, filename)
-				if input_path.endswith(".zst"):
-					file_size = os.stat(input_path).st_size
-					total_size += file_size
-					input_files.append([input_path, file_size])
-					
-		# Sort input files to process older files first
-		input_files.sort(key=lambda x: (int(os.path.basename(x[0]).split('_')[1].split('-')[0]), int(os.path.basename(x[0]).split('_')[1].split('-')[1].split('.')[0])))
-
-		log.info(f"Processing {len(input_files)} files of {(total_size / (2**30)):.2f} gigabytes")
-
-		total_lines = 0
-		total_bytes_processed = 0
-		
-		# Define fields to extract
-		fields = ["created_utc", "subreddit", "author", "title", "text", "num_comments", "id"]
-
-		for input_file in input_files:
-			file_lines = 0
-			file_bytes_processed = 0
-			created = None
-			for line, file_bytes_processed in read_lines_zst(input_file[0]):
-				obj = json.loads(line)
-				output_obj = []
-				for field in fields:
-					if field == "created_utc":
-						value = datetime.fromtimestamp(int(obj['created_utc']), UTC).strftime("%Y-%m-%d %H:%M:%S")
-					elif field == "subreddit":
-						if 'permalink' in obj:
-							subreddit_lower = f"{obj['permalink'].split('/')[2].lower()}"
-						else:
-							subreddit_lower = f"{obj['subreddit'].lower()}"
-						if subreddit_lower not in subs:
-							break
-						value = subreddit_lower
-					elif field == "author":
-						value = f"u/{obj['author']}"
-					elif field == "text":
-						if 'selftext' in obj:
-							value = obj['selftext']#[:32000] # remove first # if the subreddit has very large text posts and you want to open this in excel
-						else:
-							value = ""
-					else:
-						value = obj[field]
-					output_obj.append(str(value).encode("utf-8", errors='replace').decode())
-				
-				created = output_obj[0]
-				file_lines += 1
-
-				if file_lines == 1:
-					log.info(f"{created} : {file_lines + total_lines:,} : 0% : {(total_bytes_processed / total_size) * 100:.0f}%")
-				if file_lines % 100000 == 0:
-					log.info(f"{created} : {file_lines + total_lines:,} : {(file_bytes_processed / input_file[1]) * 100:.0f}% : {(total_bytes_processed / total_size) * 100:.0f}%")
-				
-				# Only write if all fields are present (i.e. subreddit is in subs)
-				if(len(output_obj) == len(fields)):
-					writer.writerow(output_obj)
-			total_lines += file_lines
-			total_bytes_processed += input_file[1]
-			log.info(f"{created} : {total_lines:,} : 100% : {(total_bytes_processed / total_size) * 100:.0f}%")
-			
-		log.info(f"Total: {total_lines}")
-		output_file.close()
+				file_path = os.path.relpath(os.path.join(subdir, filename), self.output_path).replace(os.sep, "/")
+				if self.is_sink_file(file_path) and (filename.endswith(".tmp") or file_path not in self.files):
+					os.remove(os.path.join(subdir, filename))
+			# Partition folders left empty
+			folder = os.path.relpath(subdir, self.output_path).replace(os.sep, "/")
+			if self.partitioned and re.fullmatch(r"subreddit=[^/]+(/year_month=[^/]+)?", folder) and not os.listdir(subdir):
+				os.rmdir(subdir)
+
+	def is_sink_file(self, file_path):
+		"""Whether a path relative to output_path is one this sink writes: RS_<YYYY-MM>.<ext> (or its hidden .tmp),
+		at the top of the folder or in subreddit=<name>/year_month=<YYYY-MM>/ when partitioned"""
+		filename = r"\.?RS_\d{4}-\d{2}\." + re.escape(self.output_format) + r"(\.tmp)?"
+		if self.partitioned:
+			return re.fullmatch(r"subreddit=[^/]+/year_month=\d{4}-\d{2}/" + filename, file_path) is not None
+		return re.fullmatch(filename, file_path) is not None
+
+	def write_file(self, file_path, columns):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+		dictionary = pa.dictionary(pa.int32(), pa.string())
+		types = [pa.timestamp("s"), dictionary, dictionary, pa.string(), pa.string(), pa.int64(), pa.string()]
+		table = pa.table({column: pa.array(columns[column], type=column_type) for column, column_type in zip(post_columns, types)})
+
+		# Written under a hidden name first so that readers of the folder never see a partial file
+		output_path = os.path.join(self.output_path, file_path)
+		os.makedirs(os.path.dirname(output_path), exist_ok=True)
+		tmp_path = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.tmp")
+		if self.output_format == "parquet":
+			pq.write_table(table, tmp_path, row_group_size=self.row_group_size)
+		else:
+			with pa.OSFile(tmp_path, "wb") as output_file, pa.ipc.new_file(output_file, table.schema) as writer:
+				writer.write_table(table, max_chunksize=self.row_group_size)
+		os.replace(tmp_path, output_path)
+
+	def process(self, obj):
+		subreddit_lower = get_subreddit(obj)
+		if subreddit_lower not in self.subreddits:
+			return
+		self.add(obj, subreddit_lower)
+
+	def add(self, obj, subreddit_lower):
+		"""Add a post already known to be in one of the subreddits"""
+		for column, value in zip(post_columns, get_post_fields(obj, subreddit_lower)):
+			if column not in ("TIMESTAMP", "NUM_COMMENTS") and value is not None:
+				value = clean_text(value)
+			self.columns[column].append(value)
+
+	def flush(self, input_file):
+		columns = self.columns
+		self.columns = {column: [] for column in post_columns}
+		filename = os.path.basename(input_file[0]).replace(".zst", f".{self.output_format}")
+
+		if not self.partitioned:
+			if not columns["POST_ID"]:
+				return [], 0
+			self.write_file(filename, columns)
+			return [filename], len(columns["POST_ID"])
+
+		# A monthly dump also holds a few posts of the month before, they go to the folder of their month
+		partitions = {}
+		for i, (subreddit, created) in enumerate(zip(columns["SUBREDDIT"], columns["TIMESTAMP"])):
+			year_month = datetime.fromtimestamp(created, UTC).strftime("%Y-%m")
+			partitions.setdefault(f"subreddit={subreddit}/year_month={year_month}/{filename}", []).append(i)
+		for file_path, rows in partitions.items():
+			self.write_file(file_path, {column: [values[i] for i in rows] for column, values in columns.items()})
+		return list(partitions), len(columns["POST_ID"])
+
+	def merge(self, result):
+		file_paths, file_rows = result
+		self.files.extend(file_paths)
+		self.rows += file_rows
+
+	def discard(self, result):
+		file_paths, file_rows = result
+		for file_path in file_paths:
+			if os.path.exists(os.path.join(self.output_path, file_path)):
+				os.remove(os.path.join(self.output_path, file_path))
+
+	def checkpoint(self):
+		return {"files": list(self.files), "rows": self.rows}
+
+class PostRouterSink(Sink):
+	"""
+	Routes every post to the post sinks (GamergateCsvSink, GamergateArrowSink) of its subreddit, so that
+	several subreddit lists are extracted to their own outputs in a single scan. The subreddit of a post is
+	computed once and looked up in a subreddit -> sinks dictionary, whatever the number of outputs.
+	"""
+
+	def __init__(self, sinks):
+		self.sinks = sinks
+		self.routes = {}
+		for sink in sinks:
+			for subreddit in sink.subreddits:
+				self.routes.setdefault(subreddit, []).append(sink)
+		self.subreddits = set(self.routes)
+
+	def config(self):
+		return {"sink": type(self).__name__, "sinks": [sink.config() for sink in self.sinks]}
+
+	def open(self, checkpoint=None):
+		for sink, sink_checkpoint in zip(self.sinks, checkpoint if checkpoint is not None else [None] * len(self.sinks)):
+			sink.open(sink_checkpoint)
+
+	def start(self, input_file):
+		for sink in self.sinks:
+			sink.start(input_file)
+
+	def process(self, obj):
+		subreddit_lower = get_subreddit(obj)
+		for sink in self.routes.get(subreddit_lower, ()):
+			sink.add(obj, subreddit_lower)
+
+	def flush(self, input_file):
+		return [sink.flush(input_file) for sink in self.sinks]
+
+	def merge(self, results):
+		for sink, result in zip(self.sinks, results):
+			sink.merge(result)
+
+	def discard(self, results):
+		for sink, result in zip(self.sinks, results):
+			sink.discard(result)
+
+	def checkpoint(self):
+		return [sink.checkpoint() for sink in self.sinks]
+
+	def close(self):
+		for sink in self.sinks:
+			sink.close()
+
+def get_post_sink(subs, output_file_path, output_format="csv", partitioned=False, compression_level=None, max_file_bytes=None, split_bodies=False):
+	if output_format in ("csv", "jsonl"):
+		if partitioned:
+			raise ValueError("Only the parquet and arrow formats can be partitioned")
+		return GamergateCsvSink(subs, output_file_path, output_format, compression_level, max_file_bytes, split_bodies)
+	if compression_level is not None or max_file_bytes is not None or split_bodies:
+		raise ValueError("Compression, rotation and body files are only available for the csv and jsonl formats")
+	return GamergateArrowSink(subs, output_file_path, output_format, partitioned=partitioned)
+
+# With workers > 1 the monthly files are decompressed in parallel, the posts are still written in chronological order
+# The files done are recorded in <output>.manifest.json, with resume=True an interrupted extraction continues where it stopped
+# output_format "parquet" or "arrow" writes a folder with one file per month instead of a single CSV,
+# partitioned=True splits it further in subreddit=<name>/year_month=<YYYY-MM>/ folders
+# For csv and jsonl, compression_level writes zstd compressed files, max_file_bytes rotates the output in files of about that size
+# and split_bodies writes BODY_TEXT to a <name>_bodies side file keyed by POST_ID
+# targets maps output paths to subreddit lists to extract all of them in one scan instead of subs and output_file_path,
+# their progress is then recorded in manifest_path
+def zst_to_gamer_gate_csv(subs=gamergate_subs, output_file_path="data/gamergate_post_data.csv", workers=1, resume=False, output_format="csv", partitioned=False,
+						  targets=None, manifest_path="data/zst_to_gamergate_csv.manifest.json", compression_level=None, max_file_bytes=None, split_bodies=False):
+	input_files, total_size = get_input_files()
+	output_options = dict(output_format=output_format, partitioned=partitioned, compression_level=compression_level, max_file_bytes=max_file_bytes, split_bodies=split_bodies)
+	if targets is None:
+		sink = get_post_sink(subs, output_file_path, **output_options)
+		manifest_path = f"{output_file_path.rstrip('/')}.manifest.json"
+	else:
+		sink = PostRouterSink([get_post_sink({sub.lower() for sub in target_subs}, target_path, **output_options)
+						   for target_path, target_subs in targets.items()])
+	scan_submissions(input_files, [sink], workers, manifest_path=manifest_path, resume=resume)
 
 
 if __name__ == '__main__':
@@ -149,14 +457,33 @@ if __name__ == '__main__':
 	parser = argparse.ArgumentParser("zst_to_gamergate_csv")
 	parser.add_argument('-l','--subreddit_list', nargs='+', help='List of subreddits', required=False)
 	parser.add_argument('-o', '--file_output_path', help="Output path", type=str, required=False)
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('-r', '--resume', help="Continue an interrupted extraction", action='store_true')
+	parser.add_argument('-f', '--format', choices=["csv", "jsonl", "parquet", "arrow"], default="csv", help="Output format, parquet and arrow write a folder with a file per month")
+	parser.add_argument('-p', '--partition', help="Partition the parquet / arrow folder by subreddit and month", action='store_true')
+	parser.add_argument('-t', '--target', nargs='+', action='append', metavar=("OUTPUT", "SUBREDDIT"),
+					 help="Output path followed by its subreddits, repeat to extract several lists in one scan (replaces -l and -o)")
+	parser.add_argument('-z', '--compression_level', type=int, help="Write a zstd compressed csv / jsonl file with this level (e.g. 3, up to 22)", required=False)
+	parser.add_argument('--max_file_mb', type=int, help="Rotate the csv / jsonl output in files of about this size", required=False)
+	parser.add_argument('--split_bodies', help="Write BODY_TEXT to a separate <name>_bodies file keyed by POST_ID", action='store_true')
 	args = parser.parse_args()
 	subs = gamergate_subs
 	if args.subreddit_list:
 		subs = args.subreddit_list
 		print(f"Using subreddit list: {subs}")
-	output_file_path = "data/gamergate_post_data.csv"
+	output_file_path = f"data/gamergate_post_data.{args.format}"
+	if args.compression_level is not None:
+		output_file_path += ".zst"
 	if args.file_output_path:
 		output_file_path = args.file_output_path
 
-	zst_to_gamer_gate_csv(subs=subs, output_file_path=output_file_path)
+	targets = None
+	if args.target:
+		if any(len(target) < 2 for target in args.target):
+			parser.error("--target expects an output path and at least one subreddit")
+		targets = {target[0]: target[1:] for target in args.target}
+
+	zst_to_gamer_gate_csv(subs=subs, output_file_path=output_file_path, workers=args.workers, resume=args.resume, output_format=args.format, partitioned=args.partition,
+						  targets=targets, compression_level=args.compression_level, max_file_bytes=args.max_file_mb * 2**20 if args.max_file_mb is not None else None,
+						  split_bodies=args.split_bodies)
 
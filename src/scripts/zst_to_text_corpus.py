@@ -0,0 +1,123 @@
+# Writes the monthly text documents of write_subreddit_monthly_text_documents (read by topics_monthly.create_collection)
+# straight from the submissions dump, without extracting the posts to a CSV first
+
+import os
+from collections import OrderedDict
+from datetime import datetime, UTC
+import logging.handlers
+import argparse
+from zst_utils import Sink, get_input_files, get_subreddit, scan_submissions
+from zst_to_gamergate_csv import gamergate_subs, clean_text
+
+
+log = logging.getLogger("bot")
+
+
+class TextCorpusSink(Sink):
+	"""
+	Appends the "TITLE\nBODY_TEXT" block of every post of the given subreddits to
+	<output_folder>/<subreddit>/<subreddit>_<YYYY-MM>.txt, blocks being separated by a newline.
+
+	The blocks of a monthly file are grouped by document in the worker, merge() then appends every group
+	to its document through a pool of at most max_open_files handles, the least recently used one being
+	closed when the pool is full. The checkpoint is the size of every document.
+	"""
+
+	def __init__(self, subs=gamergate_subs, output_folder="outputs/subreddit_text_documents_monthly", max_open_files=64):
+		self.subs = subs
+		self.subreddits = {sub.lower() for sub in subs}
+		self.output_folder = output_folder
+		self.max_open_files = max_open_files
+		self.documents = {}
+		self.handles = OrderedDict()
+		self.sizes = {}
+
+	def config(self):
+		return {"sink": type(self).__name__, "output_folder": self.output_folder, "subs": sorted(self.subreddits)}
+
+	def document_path(self, subreddit, year_month):
+		return os.path.join(subreddit, f"{subreddit}_{year_month}.txt")
+
+	def open(self, checkpoint=None):
+		self.sizes = dict(checkpoint["sizes"]) if checkpoint is not None else {}
+		# Remove the documents of a previous export, or bring them back to their size at the checkpoint
+		for subreddit in self.subreddits:
+			sub_folder = os.path.join(self.output_folder, subreddit)
+			if not os.path.isdir(sub_folder):
+				continue
+			for filename in os.listdir(sub_folder):
+				if not (filename.startswith(f"{subreddit}_") and filename.endswith(".txt")):
+					continue
+				document_path = self.document_path(subreddit, filename[len(subreddit) + 1:-len(".txt")])
+				if document_path in self.sizes:
+					os.truncate(os.path.join(self.output_folder, document_path), self.sizes[document_path])
+				else:
+					os.remove(os.path.join(self.output_folder, document_path))
+
+	def process(self, obj):
+		subreddit_lower = get_subreddit(obj)
+		if subreddit_lower not in self.subreddits:
+			return
+		self.add(obj, subreddit_lower)
+
+	def add(self, obj, subreddit_lower):
+		"""Add a post already known to be in one of the subreddits"""
+		year_month = datetime.fromtimestamp(int(obj['created_utc']), UTC).strftime("%Y-%m")
+		title = obj.get('title') or ""
+		body = obj.get('selftext') or ""
+		self.documents.setdefault(self.document_path(subreddit_lower, year_month), []).append(f"{clean_text(title)}\n{clean_text(body)}")
+
+	def flush(self, input_file):
+		documents = {document_path: "\n".join(blocks) for document_path, blocks in self.documents.items()}
+		self.documents = {}
+		return documents
+
+	def get_handle(self, document_path):
+		handle = self.handles.get(document_path)
+		if handle is not None:
+			self.handles.move_to_end(document_path)
+			return handle
+		if len(self.handles) >= self.max_open_files:
+			_, evicted = self.handles.popitem(last=False)
+			evicted.close()
+		output_path = os.path.join(self.output_folder, document_path)
+		os.makedirs(os.path.dirname(output_path), exist_ok=True)
+		handle = self.handles[document_path] = open(output_path, "ab")
+		return handle
+
+	def merge(self, documents):
+		for document_path, text in documents.items():
+			handle = self.get_handle(document_path)
+			# Blocks already in the document are followed by a separator
+			data = ("\n" + text if self.sizes.get(document_path) else text).encode("utf-8")
+			handle.write(data)
+			self.sizes[document_path] = self.sizes.get(document_path, 0) + len(data)
+
+	def checkpoint(self):
+		for handle in self.handles.values():
+			handle.flush()
+		return {"sizes": dict(self.sizes)}
+
+	def close(self):
+		for handle in self.handles.values():
+			handle.close()
+		self.handles.clear()
+		log.info(f"Wrote {len(self.sizes)} documents to {self.output_folder}")
+
+# With workers > 1 the monthly files are decompressed in parallel, the documents are still written in chronological order
+def zst_to_text_corpus(subs=gamergate_subs, output_folder="outputs/subreddit_text_documents_monthly", workers=1, resume=False, max_open_files=64):
+	input_files, total_size = get_input_files()
+	sink = TextCorpusSink(subs, output_folder, max_open_files)
+	scan_submissions(input_files, [sink], workers, manifest_path=f"{output_folder.rstrip('/')}.manifest.json", resume=resume)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser("zst_to_text_corpus")
+	parser.add_argument('-l', '--subreddit_list', nargs='+', help='List of subreddits', required=False)
+	parser.add_argument('-o', '--output_folder', help="Folder of the monthly documents", type=str, default="outputs/subreddit_text_documents_monthly")
+	parser.add_argument('-w', '--workers', help="Number of monthly files decompressed in parallel", type=int, default=1)
+	parser.add_argument('-r', '--resume', help="Continue an interrupted export", action='store_true')
+	parser.add_argument('--max_open_files', help="Number of documents kept open", type=int, default=64)
+	args = parser.parse_args()
+
+	zst_to_text_corpus(subs=args.subreddit_list or gamergate_subs, output_folder=args.output_folder, workers=args.workers,
+					resume=args.resume, max_open_files=args.max_open_files)
@@ -0,0 +1,535 @@
+# SOURCE: https://github.com/Watchful1/PushshiftDumps/blob/master/scripts/iterate_folder.py
+# Modified by Robin
+# Shared helpers for the scripts reading the monthly Pushshift RS_YYYY-MM.zst dumps
+
+import zstandard
+import os
+import re
+import json
+import time
+import pickle
+import datetime
+import logging.handlers
+from typing import TypedDict, Optional, Union
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+
+log = logging.getLogger("bot")
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+input_folder = "data/RedditDataset/reddit/submissions/"
+
+
+def read_lines_zst(file_name, chunk_size=2**27):
+	"""Yield the lines of a .zst file as bytes, with the compressed position reached in the file.
+
+	Lines are framed on the raw decompressed bytes inside one buffer reused for every chunk,
+	only the unfinished line at the end of a chunk is moved to the front of the buffer.
+	Nothing is decoded here: the JSON parsers take the bytes as they are, so a multibyte
+	character split between two chunks is never an issue.
+	"""
+	with open(file_name, 'rb') as file_handle:
+		reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(file_handle)
+		buffer = bytearray(chunk_size)
+		end = 0
+		while True:
+			if end == len(buffer):
+				# The buffer only holds the start of a single line, double its size
+				buffer.extend(bytes(len(buffer)))
+
+			with memoryview(buffer) as view:
+				read = reader.readinto(view[end:])
+				if read == 0:
+					break
+				end += read
+				file_position = file_handle.tell()
+
+				start = 0
+				newline = buffer.find(b"\n", start, end)
+				while newline != -1:
+					if newline > start:
+						yield view[start:newline].tobytes(), file_position
+					start = newline + 1
+					newline = buffer.find(b"\n", start, end)
+
+				# Move the unfinished line to the front of the buffer
+				view[:end - start] = view[start:end]
+				end -= start
+
+		if end:
+			yield bytes(buffer[:end]), file_handle.tell()
+
+		reader.close()
+
+
+def get_input_files(folder=input_folder):
+	"""Gather the monthly .zst dumps of a folder, oldest month first.
+
+	Returns:
+		input_files (list): [path, size in bytes] pairs
+		total_size (int): sum of the file sizes in bytes
+	"""
+	input_files = []
+	total_size = 0
+	for subdir, dirs, files in os.walk(folder):
+		for filename in files:
+			input_path = os.path.join(subdir, filename)
+			if input_path.endswith(".zst"):
+				file_size = os.stat(input_path).st_size
+				total_size += file_size
+				input_files.append([input_path, file_size])
+
+	# Sort input files to process older files first
+	input_files.sort(key=lambda x: (int(os.path.basename(x[0]).split('_')[1].split('-')[0]), int(os.path.basename(x[0]).split('_')[1].split('-')[1].split('.')[0])))
+	return input_files, total_size
+
+
+def imap_ordered(func, items, workers=1, discard=None):
+	"""Apply func to every item, yielding the results in the order of items.
+
+	With workers > 1 each call runs in its own process, at most 2 * workers calls are in flight
+	so that finished results waiting for an older, slower file do not pile up in memory.
+	When the consumer stops early (error or close()), the calls not started are cancelled and the results
+	of the ones already running are passed to discard.
+
+	Args:
+		func (callable): picklable (module level) function
+		items (list): arguments, one call per item
+		workers (int): number of worker processes, 1 runs everything in the current process
+		discard (callable): called with every result computed but never yielded, e.g. to remove its temporary files
+	"""
+	if workers <= 1:
+		for item in items:
+			yield func(item)
+		return
+
+	executor = ProcessPoolExecutor(max_workers=workers)
+	pending = deque()
+	try:
+		items = iter(items)
+		for item in items:
+			pending.append(executor.submit(func, item))
+			if len(pending) >= 2 * workers:
+				break
+		while pending:
+			result = pending.popleft().result()
+			for item in items:
+				pending.append(executor.submit(func, item))
+				break
+			yield result
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
+		if discard is not None:
+			for future in pending:
+				if not future.cancelled() and future.exception() is None:
+					discard(future.result())
+
+
+class Submission(TypedDict, total=False):
+	"""Fields of a submission used by the sinks, the msgspec backend only decodes these"""
+	created_utc: Union[int, float, str]
+	subreddit: str
+	permalink: str
+	author: Optional[str]
+	title: Optional[str]
+	selftext: Optional[str]
+	num_comments: Optional[int]
+	id: str
+
+
+# Fastest first
+json_backends = ["msgspec", "orjson", "json"]
+
+def get_json_loads(backend=None):
+	"""Pick the JSON parser used on every line.
+
+	Without backend the first installed one of json_backends is used. Lines the fast parsers
+	refuse (e.g. lone surrogates) are parsed again with the stdlib json module.
+
+	Returns:
+		name (str): name of the backend
+		loads (callable): parses a line (bytes) into a dict
+	"""
+	for name in ([backend] if backend else json_backends):
+		try:
+			if name == "msgspec":
+				import msgspec
+				decode = msgspec.json.Decoder(Submission).decode
+				errors = msgspec.DecodeError
+			elif name == "orjson":
+				import orjson
+				decode = orjson.loads
+				errors = orjson.JSONDecodeError
+			elif name == "json":
+				return name, json.loads
+			else:
+				raise ValueError(f"Unknown JSON backend '{name}', expected one of {json_backends}")
+		except ImportError:
+			if backend:
+				raise
+			continue
+
+		def loads(line, decode=decode, errors=errors):
+			try:
+				return decode(line)
+			except errors:
+				return json.loads(line)
+		return name, loads
+
+
+def get_subreddit(obj):
+	"""Lower case subreddit of a submission, taken from the permalink when there is one."""
+	if 'permalink' in obj:
+		return obj['permalink'].split('/')[2].lower()
+	return obj['subreddit'].lower()
+
+
+def build_subreddit_prefilter(subs):
+	"""Regex telling from the raw line if a submission may belong to one of the subreddits.
+
+	It looks case insensitively for one of the names as the "subreddit" value or in the /r/<name>/
+	part of the permalink, so every line of these subreddits matches and only a few others do.
+	"""
+	names = b"|".join(re.escape(sub.encode()) for sub in sorted(subs))
+	return re.compile(rb'(?:"subreddit":\s*"|/r\\?/)(?:' + names + rb')(?:"|\\?/)', re.IGNORECASE)
+
+
+class Sink():
+	"""
+	Consumer of the records decoded by scan_submissions.
+
+	start(), process() and flush() build the result of one monthly file, they run in a worker process
+	when scanning with several workers. merge() receives these results in chronological order
+	and is the only method writing to the outputs, it always runs in the main process between open() and close().
+	The results of a scan stopped before merging them are given to discard() instead.
+
+	A sink only interested in some subreddits sets subreddits to their lower case names,
+	when all the sinks do so the lines of other subreddits are dropped before being parsed.
+
+	To be resumable a sink describes its outputs in config() and returns their state after
+	a merge() in checkpoint(), open() then brings the outputs back to such a state.
+	"""
+
+	subreddits = None
+
+	def config(self):
+		"""JSON description of the sink, a scan is only resumed with the same sinks."""
+		return {"sink": type(self).__name__}
+
+	def open(self, checkpoint=None):
+		"""Init the outputs, or restore them to a checkpoint() when resuming."""
+		pass
+
+	def checkpoint(self):
+		"""JSON state of the outputs after the last merge()."""
+		return None
+
+	def start(self, input_file):
+		"""Start of a monthly file, before its first process()."""
+		pass
+
+	def process(self, obj):
+		raise NotImplementedError
+
+	def flush(self, input_file):
+		"""End of a monthly file, returns its (picklable) result and resets the per file state."""
+		return None
+
+	def merge(self, result):
+		pass
+
+	def discard(self, result):
+		"""Result of flush() that will never be merged because the scan stopped, e.g. remove its temporary files."""
+		pass
+
+	def close(self):
+		pass
+
+
+class Manifest():
+	"""
+	Monthly files already scanned into a set of sinks, in chronological order, with their
+	size, mtime, number of lines and the checkpoint of every sink after them.
+	It is saved as JSON after every file so that an interrupted scan can be resumed.
+	"""
+
+	def __init__(self, path, configs):
+		self.path = path
+		self.configs = configs
+		self.files = []
+
+	def load(self):
+		if not os.path.exists(self.path):
+			return
+		with open(self.path, "r", encoding='utf-8') as manifest_file:
+			manifest = json.load(manifest_file)
+		if manifest["sinks"] != self.configs:
+			log.info(f"{self.path} was written for other sinks, starting from scratch")
+			return
+		self.files = manifest["files"]
+
+	def resume_point(self, input_files):
+		"""Number of leading input files already scanned (and unchanged since) and the sink checkpoints after them."""
+		done = 0
+		for input_file, entry in zip(input_files, self.files):
+			stat = os.stat(input_file[0])
+			if (entry["name"], entry["size"], entry["mtime_ns"]) != (os.path.basename(input_file[0]), stat.st_size, stat.st_mtime_ns):
+				break
+			done += 1
+		# Files after a missing or modified one are scanned again
+		self.files = self.files[:done]
+		return done, self.files[-1]["sinks"] if done else None
+
+	def add(self, input_file, lines, checkpoints):
+		stat = os.stat(input_file[0])
+		self.files.append({
+			"name": os.path.basename(input_file[0]),
+			"size": stat.st_size,
+			"mtime_ns": stat.st_mtime_ns,
+			"lines": lines,
+			"sinks": checkpoints,
+		})
+		self.save()
+
+	def save(self):
+		# Write then rename so that a crash never leaves a truncated manifest
+		tmp_path = f"{self.path}.tmp"
+		with open(tmp_path, "w", encoding='utf-8') as manifest_file:
+			json.dump({"sinks": self.configs, "files": self.files}, manifest_file, indent=1)
+		os.replace(tmp_path, self.path)
+
+
+# Stages of scan_file, timed for every monthly file
+scan_stages = ["read", "filter", "parse", "process", "flush"]
+
+def scan_file(input_file, sinks, prefilter=None, json_backend=None):
+	"""Feed every submission of a monthly file to the sinks.
+
+	Returns:
+		stats (dict): lines, bytes and seconds spent in each of scan_stages, "read" being the decompression
+			and line framing, "filter" the prefilter, "parse" the JSON parsing and "process" / "flush" the sinks
+		results (list): flush() result of every sink
+	"""
+	_, loads = get_json_loads(json_backend)
+	file_name = os.path.basename(input_file[0])
+	file_lines = 0
+	parsed_lines = 0
+	decompressed_bytes = 0
+	read_time = filter_time = parse_time = process_time = 0.0
+	for sink in sinks:
+		sink.start(input_file)
+	start = last = time.perf_counter()
+	for line, file_bytes_processed in read_lines_zst(input_file[0]):
+		file_lines += 1
+		# Logged for every line read, whether the prefilter keeps it or not
+		if file_lines % 100000 == 0:
+			elapsed = time.perf_counter() - start
+			log.info(f"{file_name} : {file_lines:,} : {(file_bytes_processed / input_file[1]) * 100:.0f}% : {file_lines / elapsed:,.0f} lines/s")
+		now = time.perf_counter()
+		read_time += now - last
+		decompressed_bytes += len(line) + 1
+
+		if prefilter is not None:
+			match = prefilter.search(line)
+			last = time.perf_counter()
+			filter_time += last - now
+			if match is None:
+				continue
+			now = last
+
+		obj = loads(line)
+		last = time.perf_counter()
+		parse_time += last - now
+		for sink in sinks:
+			sink.process(obj)
+		parsed_lines += 1
+		now = time.perf_counter()
+		process_time += now - last
+		last = now
+
+	flush_start = time.perf_counter()
+	results = [sink.flush(input_file) for sink in sinks]
+	end = time.perf_counter()
+	read_time += flush_start - last
+
+	stats = {
+		"name": file_name,
+		"compressed_bytes": input_file[1],
+		"decompressed_bytes": decompressed_bytes,
+		"lines": file_lines,
+		"parsed_lines": parsed_lines,
+		"seconds": dict(zip(scan_stages, [read_time, filter_time, parse_time, process_time, end - flush_start])),
+		"wall_seconds": end - start,
+	}
+	return stats, results
+
+
+class ScanStats():
+	"""
+	Throughput of a scan_submissions run: totals of the per file stats of scan_file, time spent merging
+	into each sink in the main process, rates over the wall time of the run and ETA of the remaining files.
+	"""
+
+	def __init__(self, total_size, workers=1, json_backend=None, sinks=()):
+		self.total_size = total_size
+		self.workers = workers
+		self.json_backend = json_backend
+		self.sink_names = [type(sink).__name__ for sink in sinks]
+		self.started = datetime.datetime.now(datetime.UTC)
+		self.start = time.perf_counter()
+		self.files = []
+		self.merge_seconds = [0.0] * len(self.sink_names)
+
+	def add(self, file_stats, merge_seconds):
+		self.files.append(file_stats)
+		for i, seconds in enumerate(merge_seconds):
+			self.merge_seconds[i] += seconds
+
+	def totals(self):
+		wall_seconds = time.perf_counter() - self.start
+		compressed_bytes = sum(file_stats["compressed_bytes"] for file_stats in self.files)
+		decompressed_bytes = sum(file_stats["decompressed_bytes"] for file_stats in self.files)
+		lines = sum(file_stats["lines"] for file_stats in self.files)
+		remaining_seconds = (self.total_size - compressed_bytes) * wall_seconds / compressed_bytes if compressed_bytes else None
+		return {
+			"files": len(self.files),
+			"compressed_bytes": compressed_bytes,
+			"decompressed_bytes": decompressed_bytes,
+			"lines": lines,
+			"parsed_lines": sum(file_stats["parsed_lines"] for file_stats in self.files),
+			"wall_seconds": wall_seconds,
+			"compressed_mb_per_s": compressed_bytes / 2**20 / wall_seconds if wall_seconds else None,
+			"decompressed_mb_per_s": decompressed_bytes / 2**20 / wall_seconds if wall_seconds else None,
+			"lines_per_s": lines / wall_seconds if wall_seconds else None,
+			# Summed over the workers, can be more than the wall time
+			"stage_seconds": {stage: sum(file_stats["seconds"][stage] for file_stats in self.files) for stage in scan_stages},
+			"merge_seconds": dict(zip(self.sink_names, self.merge_seconds)),
+			"eta_seconds": remaining_seconds,
+		}
+
+	def progress(self):
+		"""One line summary for the log"""
+		totals = self.totals()
+		eta = str(datetime.timedelta(seconds=int(totals["eta_seconds"]))) if totals["eta_seconds"] is not None else "?"
+		return (f"{totals['compressed_mb_per_s'] or 0:.1f} MB/s compressed, {totals['decompressed_mb_per_s'] or 0:.1f} MB/s decompressed, "
+			f"{totals['lines_per_s'] or 0:,.0f} lines/s, ETA {eta}")
+
+	def summary(self):
+		return {
+			"started": self.started.isoformat(),
+			"workers": self.workers,
+			"json_backend": self.json_backend,
+			"sinks": self.sink_names,
+			"totals": self.totals(),
+			"files": self.files,
+		}
+
+	def save(self, path):
+		tmp_path = f"{path}.tmp"
+		with open(tmp_path, "w", encoding='utf-8') as stats_file:
+			json.dump(self.summary(), stats_file, indent=1)
+		os.replace(tmp_path, path)
+
+
+def _scan_file_copy(input_file, sinks_state, prefilter=None, json_backend=None):
+	return scan_file(input_file, pickle.loads(sinks_state), prefilter, json_backend)
+
+
+def scan_submissions(input_files, sinks, workers=1, json_backend=None, manifest_path=None, resume=False, stats_path=None):
+	"""Decompress and parse every submission once and feed it to all the sinks.
+
+	Args:
+		input_files (list): [path, size] pairs as returned by get_input_files
+		sinks (list): Sink instances
+		workers (int): number of monthly files decoded in parallel
+		json_backend (str): one of json_backends, the fastest installed one by default
+		manifest_path (str): where to record the files done, no manifest if None
+		resume (bool): skip the files done according to the manifest instead of starting from scratch
+		stats_path (str): where to write the ScanStats summary of the run as JSON, next to the manifest
+			(<name>.stats.json for <name>.manifest.json) by default, nowhere without manifest
+	Returns:
+		total_lines (int): number of records scanned
+	"""
+	json_backend, _ = get_json_loads(json_backend)
+
+	prefilter = None
+	if all(sink.subreddits is not None for sink in sinks):
+		prefilter = build_subreddit_prefilter(set().union(*(sink.subreddits for sink in sinks)))
+
+	if workers > 1:
+		# Workers get a copy of the sinks as they are before open(), i.e. without any output handle
+		scan = partial(_scan_file_copy, sinks_state=pickle.dumps(sinks), prefilter=prefilter, json_backend=json_backend)
+	else:
+		scan = partial(scan_file, sinks=sinks, prefilter=prefilter, json_backend=json_backend)
+
+	manifest = None
+	checkpoints = [None] * len(sinks)
+	total_lines = 0
+	if manifest_path is not None:
+		manifest = Manifest(manifest_path, [sink.config() for sink in sinks])
+		if resume:
+			manifest.load()
+			done, last_checkpoints = manifest.resume_point(input_files)
+			if done:
+				log.info(f"Resuming after {manifest.files[-1]['name']}, skipping {done} files")
+				checkpoints = last_checkpoints
+				total_lines = sum(entry["lines"] for entry in manifest.files)
+				input_files = input_files[done:]
+
+	if stats_path is None and manifest_path is not None:
+		stats_path = f"{manifest_path.removesuffix('.manifest.json')}.stats.json"
+
+	total_size = sum(input_file[1] for input_file in input_files)
+	stats = ScanStats(total_size, workers, json_backend, sinks)
+	log.info(f"Processing {len(input_files)} files of {(total_size / (2**30)):.2f} gigabytes with {workers} worker(s) into {len(sinks)} sink(s), parsing with {json_backend}")
+
+	for sink, checkpoint in zip(sinks, checkpoints):
+		sink.open(checkpoint)
+	if manifest is not None:
+		manifest.save()
+
+	def discard(file_result):
+		for sink, result in zip(sinks, file_result[1]):
+			sink.discard(result)
+
+	total_bytes_processed = 0
+	file_results = imap_ordered(scan, input_files, workers, discard=discard)
+	# Results of the file being merged, discarded with the ones still in flight if a merge fails
+	merging = None
+	try:
+		for input_file, (file_stats, results) in zip(input_files, file_results):
+			merging = file_stats, results
+			merge_seconds = []
+			for sink, result in zip(sinks, results):
+				merge_start = time.perf_counter()
+				sink.merge(result)
+				merge_seconds.append(time.perf_counter() - merge_start)
+			merging = None
+			if manifest is not None:
+				manifest.add(input_file, file_stats["lines"], [sink.checkpoint() for sink in sinks])
+			stats.add(file_stats, merge_seconds)
+			if stats_path is not None:
+				stats.save(stats_path)
+
+			total_lines += file_stats["lines"]
+			total_bytes_processed += input_file[1]
+			log.info(f"{os.path.basename(input_file[0])} : {total_lines:,} : 100% : {(total_bytes_processed / total_size) * 100:.0f}% : {stats.progress()}")
+	finally:
+		# Stops the workers and discards the files they finished but were never merged
+		file_results.close()
+		if merging is not None:
+			discard(merging)
+
+	for sink in sinks:
+		sink.close()
+	if stats_path is not None:
+		stats.save(stats_path)
+
+	totals = stats.totals()
+	log.info(f"Total: {total_lines}")
+	log.info("Seconds per stage: " + ", ".join(f"{stage} {seconds:.1f}" for stage, seconds in totals["stage_seconds"].items())
+		  + ", " + ", ".join(f"merge {name} {seconds:.1f}" for name, seconds in totals["merge_seconds"].items()))
+	return total_lines
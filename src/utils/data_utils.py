@@ -21,14 +21,14 @@ def get_sorted_subreddits_by_avg_sentiment(data, direction, min_count=500, ascen
         raise ValueError('Direction should be SOURCE_SUBREDDIT or TARGET_SUBREDDIT')
 
     # Only include subreddits with more than min_count entries
-    counts = data[direction].value_counts()
+    counts = data.groupby(direction, observed=True).size()
     popular_subs = counts[counts > min_count].index
     print(f'Using {len(popular_subs)} subreddits (>{min_count} posts)')
 
     # Compute average sentiment only for popular subreddits
     avg_sentiment_by_subreddit = (
         data[data[direction].isin(popular_subs)]
-        .groupby(direction)['LINK_SENTIMENT']
+        .groupby(direction, observed=True)['LINK_SENTIMENT']
         .mean().sort_values(ascending=ascending) 
     )
 
@@ -73,7 +73,7 @@ def compute_core_subgraph(dataframe: pd.DataFrame, k: int = 10):
 
     # === Build weighted directed graph ===
     edges = (
-        dataframe.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"])
+        dataframe.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"], observed=True)
         .size()
         .reset_index(name="weight")
     )
@@ -141,7 +141,7 @@ def top_connected(df, subreddit, n=10):
     #links from
     from_counts = (
         df[df['SOURCE_SUBREDDIT'] == subreddit]
-        .groupby('TARGET_SUBREDDIT')
+        .groupby('TARGET_SUBREDDIT', observed=True)
         .size()
         .rename('from_count')
     )
@@ -149,7 +149,7 @@ def top_connected(df, subreddit, n=10):
     #links to
     to_counts = (
         df[df['TARGET_SUBREDDIT'] == subreddit]
-        .groupby('SOURCE_SUBREDDIT')
+        .groupby('SOURCE_SUBREDDIT', observed=True)
         .size()
         .rename('to_count')
     )
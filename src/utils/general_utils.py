@@ -145,7 +145,7 @@ def mean_sentiment_per_subreddit_in_graph(G, df, features):
 
     mean_sentiment = (
         df[df['SOURCE_SUBREDDIT'].isin(valid_subreddits)]
-        .groupby('SOURCE_SUBREDDIT')['LINK_SENTIMENT']
+        .groupby('SOURCE_SUBREDDIT', observed=True)['LINK_SENTIMENT']
         .mean()
     )
 
@@ -191,7 +191,7 @@ def t_test_negativity_users(post_data: pd.DataFrame, hl_data: pd.DataFrame, subs
             Users with more than threshold posts are considered power users.
     """
     from scipy.stats import ttest_ind
-    users = post_data.groupby("USERNAME").size().reset_index(name="n_posts")
+    users = post_data.groupby("USERNAME", observed=True).size().reset_index(name="n_posts")
     merged = (
         post_data
         .merge(hl_data, on="POST_ID")
@@ -200,7 +200,7 @@ def t_test_negativity_users(post_data: pd.DataFrame, hl_data: pd.DataFrame, subs
 
     user_stats = (
         merged
-        .groupby("USERNAME")
+        .groupby("USERNAME", observed=True)
         .agg(
             n_linked_posts=("LINK_SENTIMENT", "size"),
             mean_sentiment=("LINK_SENTIMENT", "mean")
@@ -26,7 +26,7 @@ def heatmap_user_in_commun(post_data):
         post_data (df): dataframe to plot histogram
     """
 
-    subreddit_users = post_data.groupby("SUBREDDIT")["USERNAME"].apply(set)
+    subreddit_users = post_data.groupby("SUBREDDIT", observed=True)["USERNAME"].apply(set)
 
     subreddits = subreddit_users.index
     n = len(subreddits)
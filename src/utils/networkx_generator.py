@@ -138,7 +138,7 @@ def generate_graphs(df: pd.DataFrame) -> Graphs:
     gs = Graphs(nx.DiGraph(), nx.DiGraph(), nx.DiGraph())
 
     # Add the links
-    agg = df.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"])["LINK_SENTIMENT"].agg(["sum", "count"]).reset_index()
+    agg = df.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"], observed=True)["LINK_SENTIMENT"].agg(["sum", "count"]).reset_index()
     agg["inverted_sum"] = -agg["sum"]
     for _, row in agg.iterrows():
         gs.full.add_edge(
@@ -179,7 +179,7 @@ def generate_graphs(df: pd.DataFrame) -> Graphs:
 
     # Add an the attributes to the nodes
     cprint("Add the attributes to the graphs", color="green")
-    agg = df.groupby(["SOURCE_SUBREDDIT"])["LINK_SENTIMENT"].agg(["sum", "count"]).reset_index()
+    agg = df.groupby(["SOURCE_SUBREDDIT"], observed=True)["LINK_SENTIMENT"].agg(["sum", "count"]).reset_index()
     for _, row in agg.iterrows():
         for G in gs:
             subreddit = row["SOURCE_SUBREDDIT"]
@@ -21,8 +21,8 @@ def plot_distribution_nb_appearance_subreddits(data):
     """
      
     # Counts number of appearances for each subreddit
-    source_counts = data['SOURCE_SUBREDDIT'].value_counts()
-    target_counts = data['TARGET_SUBREDDIT'].value_counts()
+    source_counts = data.groupby('SOURCE_SUBREDDIT', observed=True).size()
+    target_counts = data.groupby('TARGET_SUBREDDIT', observed=True).size()
 
     plt.figure(figsize=(10, 6))
     plt.hist(source_counts, bins=10000, alpha=0.6, label="Source subreddits")
@@ -227,7 +227,7 @@ def get_animation_weekly(G, window, data, year):
         df_window = get_df_time_window(df_core, start, end)
 
         edges = (
-            df_window.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"])
+            df_window.groupby(["SOURCE_SUBREDDIT", "TARGET_SUBREDDIT"], observed=True)
             .size()
             .reset_index(name="weight")
         )
@@ -290,7 +290,7 @@ def plot_stacked_bar_chart(links_dataset, html_output=False):
     #count out links
     out_counts = (
         links_dataset
-        .groupby(['SOURCE_SUBREDDIT', 'TARGET_SUBREDDIT'])
+        .groupby(['SOURCE_SUBREDDIT', 'TARGET_SUBREDDIT'], observed=True)
         .size()
         .reset_index(name='count')
         .rename(columns={'SOURCE_SUBREDDIT': 'SUBREDDIT', 'TARGET_SUBREDDIT': 'OTHER'})
@@ -299,16 +299,16 @@ def plot_stacked_bar_chart(links_dataset, html_output=False):
     #count in links
     in_counts = (
         links_dataset
-        .groupby(['TARGET_SUBREDDIT', 'SOURCE_SUBREDDIT'])
+        .groupby(['TARGET_SUBREDDIT', 'SOURCE_SUBREDDIT'], observed=True)
         .size()
         .reset_index(name='count')
         .rename(columns={'TARGET_SUBREDDIT': 'SUBREDDIT', 'SOURCE_SUBREDDIT': 'OTHER'})
     )
 
     def split_counts(df):
-        kia   = df[df['OTHER'] == 'kotakuinaction'].groupby('SUBREDDIT')['count'].sum()
-        ghazi = df[df['OTHER'] == 'gamerghazi'].groupby('SUBREDDIT')['count'].sum()
-        other = df[~df['OTHER'].isin(['kotakuinaction', 'gamerghazi'])].groupby('SUBREDDIT')['count'].sum()
+        kia   = df[df['OTHER'] == 'kotakuinaction'].groupby('SUBREDDIT', observed=True)['count'].sum()
+        ghazi = df[df['OTHER'] == 'gamerghazi'].groupby('SUBREDDIT', observed=True)['count'].sum()
+        other = df[~df['OTHER'].isin(['kotakuinaction', 'gamerghazi'])].groupby('SUBREDDIT', observed=True)['count'].sum()
         return kia, ghazi, other
 
 
@@ -371,10 +371,10 @@ def plot_histogram_nbposts_per_user(post_data: pd.DataFrame, subs_of_interest):
         post_data (df): datafram of post, must contain subs of interest
         sub_of_interest (str[]): list of subreddit to use in histogram
     """
-    subreddits_posts_per_user = post_data.groupby(["SUBREDDIT", "USERNAME"]).size().reset_index(name="post_count")
+    subreddits_posts_per_user = post_data.groupby(["SUBREDDIT", "USERNAME"], observed=True).size().reset_index(name="post_count")
     subreddit_sizes = (
         subreddits_posts_per_user
-        .groupby("SUBREDDIT")
+        .groupby("SUBREDDIT", observed=True)
         .size()
         .rename("subreddit_size")
     )
@@ -411,7 +411,7 @@ def plot_posts_percent_positive_by_posts_per_user(post_data: pd.DataFrame, hl_da
         subs_of_interest (str[]): subreddit of interest
     """
     merged_df = pd.merge(left=post_data, right=hl_data, how="inner", on="POST_ID").loc[lambda d: d["SUBREDDIT"].isin(subs_of_interest)]
-    df_plot = merged_df.groupby(["LINK_SENTIMENT", "USERNAME"]).size().reset_index(name="post_count")
+    df_plot = merged_df.groupby(["LINK_SENTIMENT", "USERNAME"], observed=True).size().reset_index(name="post_count")
 
     fig, ax = plt.subplots(figsize=(8, 5))
 
@@ -976,7 +976,7 @@ def plot_posts_with_deleted_body(post_data: pd.DataFrame, byUser=True, byModerat
         post_data["body_deleted"] = (post_data["BODY_TEXT"] == "[removed]")
     else:
         raise ValueError("byUser and byModerator cannot be both false.")
-    deleted_percentage = (post_data.groupby('SUBREDDIT')["body_deleted"].mean() * 100).sort_values(ascending=False)
+    deleted_percentage = (post_data.groupby('SUBREDDIT', observed=True)["body_deleted"].mean() * 100).sort_values(ascending=False)
 
     # Non interactive plot in results notebook
     plt.figure(figsize=(12, 6))
@@ -6,7 +6,7 @@ from src.data.some_dataloader import RedditPostDataset
 def get_core_gg_users(gg_df, subs_gg, min_posts=2):
     gg_filtered = gg_df[gg_df["SUBREDDIT"].isin(subs_gg)]
 
-    gg_user_counts = gg_filtered.groupby("USERNAME").size()
+    gg_user_counts = gg_filtered.groupby("USERNAME", observed=True).size()
     core_users = set(gg_user_counts[gg_user_counts >= min_posts].index)
 
     return core_users
@@ -46,7 +46,7 @@ def proportion_of_gg_in_politics_multiple_lines(gg_df, pol_df, max_n=10):
 
     for min_posts in range(1, max_n + 1):
 
-        gg_counts = gg_only.groupby("USERNAME").size()
+        gg_counts = gg_only.groupby("USERNAME", observed=True).size()
         gg_users = set(gg_counts[gg_counts >= min_posts].index)
 
         if not gg_users:
@@ -54,7 +54,7 @@ def proportion_of_gg_in_politics_multiple_lines(gg_df, pol_df, max_n=10):
 
         gg_first_seen = (
             gg_only[gg_only["USERNAME"].isin(gg_users)]
-            .groupby("USERNAME")["quarter"]
+            .groupby("USERNAME", observed=True)["quarter"]
             .min()
         )
 
@@ -311,7 +311,7 @@ def proportion_of_gaming_in_politics_multiple_lines(gg_df, pol_df, max_n=10):
 
     for min_posts in range(1, max_n + 1):
 
-        gg_counts = gg_only.groupby("USERNAME").size()
+        gg_counts = gg_only.groupby("USERNAME", observed=True).size()
         gg_users = set(gg_counts[gg_counts >= min_posts].index)
 
         if not gg_users:
@@ -319,7 +319,7 @@ def proportion_of_gaming_in_politics_multiple_lines(gg_df, pol_df, max_n=10):
 
         gg_first_seen = (
             gg_only[gg_only["USERNAME"].isin(gg_users)]
-            .groupby("USERNAME")["quarter"]
+            .groupby("USERNAME", observed=True)["quarter"]
             .min()
         )
 
@@ -2,6 +2,7 @@ import statsmodels.formula.api as smf
 import pickle
 import pandas as pd
 from src.utils.data_utils import *
+from src.data.some_dataloader import liwc_cols
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from sklearn.model_selection import train_test_split
@@ -16,9 +17,9 @@ def train_logit_link_sentiment_timewindow(df, properties, save_path, from_date,
         over a given time window. 
     
     Args:
-        data (df): dataframe containing 'LINK_SENTIMENT', 'TIMESTAMP' and 'PROPERTIES'
+        data (df): dataframe containing 'LINK_SENTIMENT', 'TIMESTAMP' and the property columns (liwc_cols)
         properties (int[]): list of the properties to use for logit, the number refers to 
-            the place of the property in the vector 'PROPERIES' as given in the paper
+            the place of the property in liwc_cols as given in the paper
         save_path (str): file path to save the model 
         from_date (str): 'YYYY-MM-DD' Start date included
         to_date (str): 'YYYY-MM-DD' End date excluded
@@ -32,9 +33,9 @@ def train_logit_link_sentiment(df, properties, save_path):
     """ Train logistic regression model over properties features to classify link sentiment of post.
 
     Args:
-        df (df): dataframe containing 'LINK_SENTIMENT' and 'PROPERTIES'
+        df (df): dataframe containing 'LINK_SENTIMENT' and the property columns (liwc_cols)
         properties (int[]): list of the properties to use for logit, the number refers to 
-            the place of the property in the vector 'PROPERTIES' as given in the paper
+            the place of the property in liwc_cols as given in the paper
         save_path (str): save model in this file
     """
 
@@ -47,11 +48,9 @@ def train_logit_link_sentiment(df, properties, save_path):
     if 'LINK_SENTIMENT' not in df.columns:
         raise ValueError("LINK_SENTIMENT column is missing")
 
-    # Expand property vectors into individual columns
-    prop_df = pd.DataFrame(df['PROPERTIES'].tolist())
-    prop_df.columns = [f"prop_{i+1}" for i in range(prop_df.shape[1])]
-    selected_cols = [prop_df.columns[i-1] for i in properties]
-    df = pd.concat([df, prop_df[selected_cols]], axis=1)
+    # Property columns of the dataset under formula friendly names
+    selected_cols = [f"prop_{i}" for i in properties]
+    df = df.assign(**{f"prop_{i}": df[liwc_cols[i-1]] for i in properties})
 
     # logistic regression demands value 0 or 1 (-1.0 => 0.0)
     df['LINK_SENTIMENT'] = df['LINK_SENTIMENT'].astype(float)